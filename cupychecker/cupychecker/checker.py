@@ -1,13 +1,148 @@
+import json
+import sys
+import traceback
+
 import requests
 
 from .helpers import TestHelper
 
 
-def run_code(code, host='http://localhost:8000'):
+MSGPACK = 'application/msgpack'
+
+
+def _print_output(name, text):
+    """
+    Вывод куска stdout/stderr по мере поступления
+    """
+    stream = sys.stderr if name == 'stderr' else sys.stdout
+    stream.write(text)
+    stream.flush()
+
+
+def check_syntax(code):
+    """
+    Проверка синтаксиса без обращения к Runner.
+    Возвращает None, если код компилируется, иначе результат в том же виде,
+    что отдаёт /run для кода с синтаксической ошибкой (с полем 'syntax_error').
+    Если на коде переполняется стек парсера, тоже None: ошибку вернёт Runner
+    """
+    try:
+        compile(code, 'main.py', 'exec', dont_inherit=True)
+        return None
+    except (MemoryError, RecursionError):
+        return None
+    except SyntaxError as err:
+        error = err
+        syntax_error = {
+            'line': err.lineno,
+            'offset': err.offset,
+            'end_line': err.end_lineno,
+            'end_offset': err.end_offset,
+            'message': err.msg,
+            'text': err.text.rstrip('\n') if err.text is not None else None,
+        }
+    except ValueError as err:
+        # до Python 3.12 нулевые байты в исходнике дают ValueError
+        error = err
+        syntax_error = {'message': str(err)}
+    return {
+        'stdout': '',
+        'stderr': ''.join(traceback.format_exception_only(type(error), error)),
+        'return_code': 1,
+        'timeout': False,
+        'syntax_error': syntax_error,
+    }
+
+
+def _request_body(code, plots=None, **fields):
+    body = {'code': f'{code}', **fields}
+    if plots is not None:
+        body['plots'] = plots
+    return body
+
+
+def _post_msgpack(url, body):
+    """
+    Запрос и ответ в msgpack: компактнее JSON для большого вывода и графиков.
+    Сжатие ответа (gzip, zstd) requests распаковывает сам
+    """
+    import msgpack
+
+    response = requests.post(
+        url,
+        data=msgpack.packb(body, use_bin_type=True),
+        headers={'Content-Type': MSGPACK, 'Accept': MSGPACK}
+    )
+    response.raise_for_status()
+    # ошибки и старые версии Runner отвечают JSON
+    if response.headers.get('Content-Type', '').startswith(MSGPACK):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def run_code(code, host='http://localhost:8000', stream=False, on_output=None, plots=None, binary=False):
     """
     Запуск кода на Runner
+
+    При stream=True вывод читается из /run/stream по мере выполнения программы:
+    on_output(name, text) вызывается для каждого куска stdout/stderr
+    (по умолчанию печатает его), а результат собирается в тот же словарь,
+    что возвращает /run
+
+    plots='png' или 'svg' — вернуть графики программы в поле 'artifacts'
+
+    binary=True — обмен с Runner в msgpack вместо JSON (нужен пакет msgpack)
     """
+    if stream:
+        return _run_code_stream(code, host, on_output or _print_output, plots)
+
     endpoint = '/run'
+    if binary:
+        return _post_msgpack(host + endpoint, _request_body(code, plots))
+    response = requests.post(
+        host + endpoint,
+        json=_request_body(code, plots)
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
+def _run_code_stream(code, host, on_output, plots=None):
+    """
+    Чтение Server-Sent Events от /run/stream
+    """
+    endpoint = '/run/stream'
+    response = requests.post(
+        host + endpoint,
+        json=_request_body(code, plots),
+        stream=True
+    )
+    response.raise_for_status()
+
+    result = {'stdout': '', 'stderr': ''}
+    event = None
+    for raw_line in response.iter_lines():
+        line = raw_line.decode('utf-8')
+        if line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data = json.loads(line[len('data:'):])
+            if event in ('stdout', 'stderr'):
+                result[event] += data['text']
+                on_output(event, data['text'])
+            elif event == 'result':
+                result.update(data)
+
+    return result
+
+
+def submit_job(code, host='http://localhost:8000'):
+    """
+    Постановка кода в очередь Runner без ожидания результата.
+    Возвращает задание: {'id': ..., 'status': ...}
+    """
+    endpoint = '/jobs'
     response = requests.post(
         host + endpoint,
         json={
@@ -19,6 +154,38 @@ def run_code(code, host='http://localhost:8000'):
     return response.json()
 
 
+def get_job(job_id, host='http://localhost:8000', wait=0):
+    """
+    Состояние задания. При wait > 0 сервер держит запрос, пока задание
+    не завершится, но не дольше wait секунд. Результат запуска — в поле 'result'
+    """
+    endpoint = f'/jobs/{job_id}'
+    response = requests.get(
+        host + endpoint,
+        params={
+            'wait': wait
+        }
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
+def check_code(code, module, task, host='http://localhost:8000', plots=None):
+    """
+    Запуск кода и проверка по проверкам задачи на стороне Runner за один запрос.
+    Возвращает {'passed': bool, 'message': str | None, 'result': {...как у /run...}}
+    """
+    endpoint = '/check'
+    response = requests.post(
+        host + endpoint,
+        json=_request_body(code, plots, module=module, task=task)
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
 def check_result(code: str, stdout: str, task_conf: dict, host=None):
     """
     Проверка результата
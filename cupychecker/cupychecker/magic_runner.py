@@ -1,13 +1,45 @@
 from IPython.core.magic import register_cell_magic
-from IPython.display import HTML, display, Markdown
+from IPython.display import HTML, SVG, Image, display, Markdown
 import argparse
+import base64
+import json
 import shlex
 import os
 
-from .checker import run_code, check_result
+from .checker import run_code, check_result, check_code, check_syntax
 from .task_loader import load_remote, load_local, load_from_str
 
 
+def runner_error(runner_result):
+    """
+    Текст ошибки запуска или None, если программа отработала без ошибок.
+    Программа, остановленная по лимиту, могла ничего не написать в stderr
+    """
+    if runner_result.get('stderr') != '':
+        return runner_result.get('stderr')
+    if runner_result.get('timeout'):
+        return 'Execution timed out'
+    if runner_result.get('limit_exceeded'):
+        return f"Limit exceeded: {runner_result.get('limit_exceeded')}"
+    return None
+
+
+def display_artifacts(runner_result):
+    """
+    Показ графиков, которые Runner собрал при выполнении программы
+    """
+    for artifact in runner_result.get('artifacts') or []:
+        data = base64.b64decode(artifact['data'])
+        if artifact['mime_type'] == 'image/png':
+            display(Image(data=data, format='png'))
+        elif artifact['mime_type'] == 'image/svg+xml':
+            display(SVG(data=data))
+        else:
+            display({artifact['mime_type']: json.loads(data)}, raw=True)
+    if runner_result.get('artifacts_truncated'):
+        display(Markdown('_Часть графиков не показана: превышен допустимый объём_'))
+
+
 @register_cell_magic
 def run(line, cell):
     # Пытаемся понять где живет runner для запуска кода и хранения проверок
@@ -22,6 +54,7 @@ def run(line, cell):
     parser.add_argument('--module', type=str, required=True)
     parser.add_argument('--task', type=str, required=True)
     parser.add_argument('--plot', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction)
     parser.add_argument('--pyrunner', type=str, required=False, default=pyrunner_default_host)
     parser.add_argument('--checks-location', type=str, required=False, default="remote")
 
@@ -29,10 +62,23 @@ def run(line, cell):
     print(args, end='\n')
 
     # Запускаем код
-    runner_result = run_code(code=cell, host=args.pyrunner)
+    # При --checks-location server код и проверки выполняются на Runner за один запрос,
+    # при --stream вывод печатается по мере выполнения программы
+    # При --plot графики строятся на Runner и возвращаются вместе с результатом.
+    # Код с синтаксической ошибкой на Runner не отправляется
+    plots = 'png' if args.plot else None
+    runner_result = check_syntax(cell)
+    if runner_result is None and args.checks_location == "server":
+        server_check = check_code(
+            code=cell, module=args.module, task=args.task, host=args.pyrunner, plots=plots
+        )
+        runner_result = server_check['result']
+    elif runner_result is None:
+        runner_result = run_code(code=cell, host=args.pyrunner, stream=bool(args.stream), plots=plots)
 
     # Выкидываем ошибку клиенту
-    if runner_result.get('stderr') != '':
+    error = runner_error(runner_result)
+    if error is not None:
         return HTML(f"""
         <div style="
             background-color:#f8d7da;
@@ -43,31 +89,35 @@ def run(line, cell):
             font-family:Arial;
             font-size:16px;
             font-weight:bold;">
-            ❌ Ошибка: {runner_result.get('stderr')}
+            ❌ Ошибка: {error}
         </div>
         """)
     else:
-        if args.checks_location == "remote":
-            # Если хост указан, то забираем проверки через API
-            task_config = load_remote(module=args.module, task=args.task, host=args.pyrunner)
+        if args.checks_location == "server":
+            # Проверки уже выполнены на сервере
+            checker_result = True if server_check['passed'] else server_check['message']
         else:
-            # Иначе используем встроенные проверки
-            task_config = load_local(module=args.module, task=args.task)
-
-        # Делаем проверки реpультата
-        checker_result = check_result(
-            code=cell,
-            stdout=runner_result.get('stdout'),
-            task_conf=task_config,
-            host=args.pyrunner # Отсюда заберем yaml проверок
-        )
+            if args.checks_location == "remote":
+                # Если хост указан, то забираем проверки через API
+                task_config = load_remote(module=args.module, task=args.task, host=args.pyrunner)
+            else:
+                # Иначе используем встроенные проверки
+                task_config = load_local(module=args.module, task=args.task)
+
+            # Делаем проверки реpультата
+            checker_result = check_result(
+                code=cell,
+                stdout=runner_result.get('stdout'),
+                task_conf=task_config,
+                host=args.pyrunner # Отсюда заберем yaml проверок
+            )
 
         # Выводим stdout
-        # Если указан plot, то дополнительно строим график
-        if args.plot:
-            exec(cell)
-        else:
+        # Если указан plot, то дополнительно показываем графики
+        if not args.stream or args.checks_location == "server":
             display(Markdown(f'```\n{runner_result.get('stdout')}\n```'))
+        if args.plot:
+            display_artifacts(runner_result)
 
         # Если не прошли прверку, то сообщение об ошибке
         if checker_result is not True:
@@ -101,13 +151,16 @@ def run(line, cell):
         """)
 
 
-def test_run(code: str, task_conf_str: str, plot=False, pyrunner="http://localhost:8000"):
+def test_run(code: str, task_conf_str: str, plot=False, pyrunner="http://localhost:8000", stream=False):
 
-    # Запускаем код
-    runner_result = run_code(code=code, host=pyrunner)
+    # Запускаем код (если он хотя бы компилируется)
+    runner_result = check_syntax(code) or run_code(
+        code=code, host=pyrunner, stream=stream, plots='png' if plot else None
+    )
 
     # Выкидываем ошибку клиенту
-    if runner_result.get('stderr') != '':
+    error = runner_error(runner_result)
+    if error is not None:
         return HTML(f"""
         <div style="
             background-color:#f8d7da;
@@ -118,7 +171,7 @@ def test_run(code: str, task_conf_str: str, plot=False, pyrunner="http://localho
             font-family:Arial;
             font-size:16px;
             font-weight:bold;">
-            ❌ Ошибка: {runner_result.get('stderr')}
+            ❌ Ошибка: {error}
         </div>
         """)
     else:
@@ -133,11 +186,11 @@ def test_run(code: str, task_conf_str: str, plot=False, pyrunner="http://localho
         )
 
         # Выводим stdout
-        # Если указан plot, то дополнительно строим график
-        if plot:
-            exec(code)
-        else:
+        # Если указан plot, то дополнительно показываем графики
+        if not stream:
             display(Markdown(f'```\n{runner_result.get('stdout')}\n```'))
+        if plot:
+            display_artifacts(runner_result)
 
         # Если не прошли прверку, то сообщение об ошибке
         if checker_result is not True:
@@ -20,22 +20,39 @@ def load_local(module: str, task: str):
         return yaml.safe_load(f)
 
 
+# Проверки, уже полученные с сервера: (host, module, task) -> (ETag, данные)
+_remote_cache = {}
+
+
 def load_remote(module: str, task: str, host: str):
     """
-    Получение списка проверок для задачи в формате YAML с сервера
+    Получение списка проверок для задачи в формате YAML с сервера.
+    Повторный запрос отправляется с If-None-Match: если проверки
+    не изменились, сервер отвечает 304 без тела
     """
     
     endpoint = "/task_checks"
+    key = (host, module, task)
+    cached = _remote_cache.get(key)
 
     response = requests.get(
         host + endpoint,
         params={
             "module": module,
             "task": task
-        }
+        },
+        headers={"If-None-Match": cached[0]} if cached else None
     )
 
-    return response.json().get("data")
+    if response.status_code == 304 and cached:
+        return cached[1]
+    response.raise_for_status()
+
+    data = response.json().get("data")
+    etag = response.headers.get("ETag")
+    if etag:
+        _remote_cache[key] = (etag, data)
+    return data
 
 
 def load_from_str(task_conf_str: str):
@@ -0,0 +1,119 @@
+"""
+Сбор артефактов (графиков), которые программа сохранила в workspace.
+
+Директория принадлежит пользователю слота, а читает её runner под root,
+поэтому файлы открываются без перехода по символическим ссылкам
+и принимаются только обычные файлы этого пользователя. Одинаковые
+по содержимому файлы (график, показанный дважды) возвращаются один раз,
+суммарный объём ограничен
+"""
+import base64
+import hashlib
+import os
+import stat
+
+
+DIRECTORY = ".artifacts"
+MIME_TYPES = {
+    ".png": "image/png",
+    ".svg": "image/svg+xml",
+    ".json": "application/vnd.plotly.v1+json",
+}
+
+
+def prepare(workdir, uid, gid):
+    """
+    Создаёт пустую директорию для артефактов, доступную программе
+    """
+    path = os.path.join(workdir, DIRECTORY)
+    os.mkdir(path, 0o700)
+    os.chown(path, uid, gid)
+    return path
+
+
+class TooLarge(Exception):
+    pass
+
+
+def _read(dir_fd, name, uid, limit):
+    """
+    Содержимое файла или None, если это не обычный файл пользователя.
+    Если файл больше limit байт, бросает TooLarge
+    """
+    try:
+        fd = os.open(name, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK, dir_fd=dir_fd)
+    except OSError:
+        return None
+    try:
+        info = os.fstat(fd)
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != uid:
+            return None
+        with os.fdopen(fd, "rb", closefd=False) as f:
+            data = f.read(limit + 1)
+        if len(data) > limit:
+            raise TooLarge()
+        return data
+    finally:
+        os.close(fd)
+
+
+def read(workdir, name, uid, max_size):
+    """
+    Содержимое служебного файла программы в workdir (например, профиля)
+    с теми же проверками. None, если файла нет, он не подходит или больше max_size
+    """
+    try:
+        dir_fd = os.open(workdir, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+    try:
+        return _read(dir_fd, name, uid, max_size)
+    except TooLarge:
+        return None
+    finally:
+        os.close(dir_fd)
+
+
+def collect(workdir, uid, max_size):
+    """
+    Возвращает (артефакты, обрезаны ли). Артефакт — словарь для models.Artifact
+    с содержимым в base64, в порядке создания
+    """
+    try:
+        dir_fd = os.open(os.path.join(workdir, DIRECTORY), os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    except OSError:
+        return [], False
+
+    artifacts = []
+    seen = set()
+    total = 0
+    truncated = False
+    try:
+        if os.fstat(dir_fd).st_uid != uid:
+            return [], False
+        for name in sorted(os.listdir(dir_fd)):
+            mime_type = MIME_TYPES.get(os.path.splitext(name)[1])
+            if mime_type is None:
+                continue
+            try:
+                data = _read(dir_fd, name, uid, max_size - total)
+            except TooLarge:
+                truncated = True
+                continue
+            if data is None:
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            total += len(data)
+            artifacts.append({
+                "name": name,
+                "mime_type": mime_type,
+                "sha256": digest,
+                "size": len(data),
+                "data": base64.b64encode(data).decode("ascii"),
+            })
+    finally:
+        os.close(dir_fd)
+    return artifacts, truncated
@@ -0,0 +1,173 @@
+"""
+Кэш результатов запусков с адресацией по содержимому.
+
+Ключ — хэш кода, ограничений запуска, версии датасетов и отпечатка
+интерпретатора с установленными пакетами. Два уровня: LRU в памяти
+и каталог на диске с TTL и ограничением по суммарному размеру.
+Безопасно переиспользовать можно только результаты детерминированных
+запусков, поэтому кэш включает детерминированный режим (см. runner.py)
+"""
+from collections import OrderedDict
+from importlib import metadata
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+
+def interpreter_fingerprint(extra=""):
+    """
+    Отпечаток интерпретатора и всех установленных пакетов
+    """
+    packages = sorted(
+        f"{dist.metadata['Name']}=={dist.version}"
+        for dist in metadata.distributions()
+    )
+    payload = "\n".join([sys.version, extra, *packages])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DatasetsVersion:
+    """
+    Версия каталога с датасетами: хэш путей, размеров и времени изменения файлов.
+    Пересчитывается не чаще раза в interval секунд
+    """
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self._value = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _compute(self):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(self.path, followlinks=True):
+            dirs.sort()
+            for name in sorted(files):
+                full_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                digest.update(
+                    f"{os.path.relpath(full_path, self.path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode()
+                )
+        return digest.hexdigest()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._value is None or now - self._checked_at > self.interval:
+                self._value = self._compute()
+                self._checked_at = now
+            return self._value
+
+
+class ResultCache:
+    """
+    Двухуровневый кэш: LRU в памяти и файлы на диске.
+    Значения — словари (сериализованный RunPythonResponse)
+    """
+
+    def __init__(self, directory, memory_items=1024, ttl=86400, disk_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.disk_size = disk_size
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._disk = OrderedDict()  # key -> (size, created_at), от старых к новым
+        self._disk_total = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        # Индекс файлов на диске строим один раз при старте
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        for created_at, key, size in sorted(entries):
+            self._disk[key] = (size, created_at)
+            self._disk_total += size
+
+    def _remove_disk(self, key):
+        size, _ = self._disk.pop(key)
+        self._disk_total -= size
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                value, created_at = self._memory[key]
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            if key not in self._disk:
+                return None
+            _, created_at = self._disk[key]
+            if now - created_at > self.ttl:
+                self._remove_disk(key)
+                return None
+
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            self._put_memory(key, value, created_at)
+        return value
+
+    def _put_memory(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def put(self, key, value):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # запись через временный файл, чтобы читатель не увидел половину
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._put_memory(key, value, now)
+            if key in self._disk:
+                self._disk_total -= self._disk.pop(key)[0]
+            self._disk[key] = (len(data), now)
+            self._disk_total += len(data)
+            # вытесняем самые старые записи
+            while self._disk_total > self.disk_size and self._disk:
+                self._remove_disk(next(iter(self._disk)))
@@ -0,0 +1,115 @@
+"""
+Уборка процессов после запуска.
+
+У каждого слота своя cgroup v2. Программа попадает в неё ещё до сброса
+привилегий, все её потомки — автоматически, и выйти из неё без прав root
+нельзя (в отличие от группы процессов, которую меняет обычный setsid).
+По окончании запуска все процессы убиваются одной записью в cgroup.kill.
+
+Счётчики memory.events и pids.events показывают, что программу остановило
+ядро (OOM killer, отказ в fork), а не она сама написала что-то похожее в stderr.
+
+Нужен смонтированный на запись cgroup2 (в Docker — --cgroupns=private
+и cgroup v2 на хосте). Если его нет, процессы пользователя слота
+добиваются обходом /proc — это медленнее, но без fork и shell
+"""
+import os
+import signal
+from contextlib import suppress
+
+
+class Cgroup:
+    """
+    cgroup v2 одного слота
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def create(cls, root, name):
+        """
+        Создаёт (или переиспользует) cgroup root/name. None, если cgroup v2 недоступна
+        """
+        path = os.path.join(root, name)
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            return None
+        # контроллеры для счётчиков событий; без них cgroup всё равно годится для kill
+        with suppress(OSError):
+            with open(os.path.join(root, "cgroup.subtree_control"), "w") as f:
+                f.write("+memory +pids")
+        if not os.path.exists(os.path.join(path, "cgroup.kill")):
+            return None
+        return cls(path)
+
+    def add(self, pid=0):
+        """
+        Переносит процесс в cgroup; 0 — текущий процесс.
+        Вызывается в дочернем процессе до сброса привилегий
+        """
+        with open(os.path.join(self.path, "cgroup.procs"), "w") as f:
+            f.write(str(pid))
+
+    def kill(self):
+        """
+        SIGKILL всем процессам cgroup, включая тех, кто успеет сделать fork во время убийства
+        """
+        with open(os.path.join(self.path, "cgroup.kill"), "w") as f:
+            f.write("1")
+
+    def freeze(self, frozen=True):
+        """
+        Останавливает (frozen=False — возобновляет) все процессы cgroup.
+        SIGKILL и cgroup.kill доходят и до замороженных процессов
+        """
+        with open(os.path.join(self.path, "cgroup.freeze"), "w") as f:
+            f.write("1" if frozen else "0")
+
+    def set(self, name, value):
+        """
+        Записывает настройку контроллера (например, pids.max).
+        False, если контроллер не включён
+        """
+        try:
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write(str(value))
+        except OSError:
+            return False
+        return True
+
+    def events(self, controller):
+        """
+        Счётчики из <controller>.events; пустой словарь, если контроллер не включён
+        """
+        try:
+            with open(os.path.join(self.path, f"{controller}.events")) as f:
+                return {key: int(value) for key, value in (line.split() for line in f if line.strip())}
+        except (OSError, ValueError):
+            return {}
+
+    def remove(self):
+        with suppress(OSError):
+            os.rmdir(self.path)
+
+
+def kill_user_processes(uid, attempts=5):
+    """
+    Запасной вариант без cgroup: SIGKILL всем процессам пользователя.
+    Пока идёт обход, процессы могут успеть сделать fork, поэтому обход повторяется
+    """
+    for _ in range(attempts):
+        found = False
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                if entry.stat().st_uid != uid:
+                    continue
+                os.kill(int(entry.name), signal.SIGKILL)
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            found = True
+        if not found:
+            return
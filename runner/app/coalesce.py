@@ -0,0 +1,87 @@
+"""
+Схлопывание одинаковых запусков (single-flight).
+
+Двойной клик по «Run» и повторы из ноутбука присылают одну и ту же программу
+несколько раз подряд. Запросы с одним ключом, пришедшие, пока программа
+исполняется, ждут её результата вместо своего запуска, а завершённый результат
+ещё retention секунд отдаётся повторам без исполнения.
+
+Ключ — либо ключ идемпотентности клиента, либо (в детерминированном режиме)
+хэш кода и ограничений. С ключом запоминается отпечаток запроса: тот же ключ
+с другим кодом — ошибка клиента, а не повтор
+"""
+from collections import OrderedDict
+import asyncio
+import time
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+class _Flight:
+    def __init__(self, fingerprint, task):
+        self.fingerprint = fingerprint
+        self.task = task
+        # сколько запросов ждут результата
+        self.waiters = 0
+
+
+class Coalescer:
+    def __init__(self, retention=30.0, max_results=10000):
+        self.retention = retention
+        self.max_results = max_results
+        self._flights = {}
+        # key -> (отпечаток, момент завершения, результат), от старых к новым
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._results:
+            key, (_, finished_at, _) = next(iter(self._results.items()))
+            if now - finished_at <= self.retention and len(self._results) <= self.max_results:
+                break
+            del self._results[key]
+
+    def _finished(self, key, flight, task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is None and self.retention > 0:
+            self._results[key] = (flight.fingerprint, time.monotonic(), task.result())
+            self._results.move_to_end(key)
+            self._expire()
+
+    async def run(self, key, fingerprint, run):
+        """
+        Результат run() для ключа и признак того, что он получен чужим запуском.
+        Исполнение отменяется, только когда его перестали ждать все запросы
+        """
+        self._expire()
+        if key in self._results:
+            stored_fingerprint, _, result = self._results[key]
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency key was already used for a different request")
+            return result, True
+
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            if flight.fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency key is in use by a different request")
+        else:
+            flight = _Flight(fingerprint, asyncio.ensure_future(run()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finished(key, flight, task))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
@@ -0,0 +1,344 @@
+"""
+Диспетчер: тот же HTTP API, что у runner, поверх нескольких экземпляров runner.
+
+Каждый запрос уходит на доступный бэкенд с наименьшим числом незавершённых
+запросов. Бэкенды периодически проверяются через GET /health: ошибки
+и медленные ответы подряд (и ошибки проксируемых запросов, кроме 503
+от заполненного бэкенда) выводят бэкенд
+из ротации на DISPATCHER__EJECT_TIME секунд. Запрос, который бэкенд точно
+не начал выполнять (не удалось соединиться или 503), повторяется на другом.
+
+Задания (/jobs) и сессии (/sessions) живут на конкретном бэкенде, поэтому
+к их id добавляется номер бэкенда. Запуски с ключом идемпотентности уходят
+на бэкенд, выбранный по ключу, чтобы повторы схлопнулись с первым запуском.
+
+Запуск: DISPATCHER__BACKENDS=http://runner1:8000,http://runner2:8000 python app/dispatcher.py
+"""
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+import uvicorn
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+import httpx
+
+from transport import TransportMiddleware
+
+
+BACKENDS = [
+    url.strip().rstrip('/')
+    for url in os.getenv('DISPATCHER__BACKENDS', 'http://localhost:8001').split(',')
+    if url.strip()
+]
+# Активные проверки: период, таймаут и время ответа, начиная с которого бэкенд считается медленным
+HEALTH_INTERVAL = float(os.getenv('DISPATCHER__HEALTH_INTERVAL', 2))
+HEALTH_TIMEOUT = float(os.getenv('DISPATCHER__HEALTH_TIMEOUT', 1))
+SLOW_THRESHOLD = float(os.getenv('DISPATCHER__SLOW_THRESHOLD', 0.5))
+# Сколько неудач подряд выводят бэкенд из ротации и на сколько секунд
+MAX_FAILURES = int(os.getenv('DISPATCHER__MAX_FAILURES', 3))
+EJECT_TIME = float(os.getenv('DISPATCHER__EJECT_TIME', 10))
+CONNECT_TIMEOUT = float(os.getenv('DISPATCHER__CONNECT_TIMEOUT', 2))
+# Сколько бэкендов пробовать для одного запроса
+MAX_ATTEMPTS = int(os.getenv('DISPATCHER__MAX_ATTEMPTS', 3))
+
+# Заголовки, которые относятся к соединению, а не к содержимому
+HOP_HEADERS = {'host', 'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'upgrade'}
+NEGOTIATION_HEADERS = {'accept', 'accept-encoding'}
+
+
+class Backend:
+    """
+    Один экземпляр runner
+    """
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        # запросов, отправленных и ещё не завершённых
+        self.outstanding = 0
+        # неудач подряд
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.ejected_until
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= MAX_FAILURES:
+            self.ejected_until = time.monotonic() + EJECT_TIME
+            self.failures = 0
+
+
+backends = [Backend(index, url) for index, url in enumerate(BACKENDS)]
+client = None
+
+
+def _choose(exclude):
+    """
+    Доступный бэкенд с наименьшим числом незавершённых запросов.
+    Если выведены из ротации все — лучше попробовать любой, чем отказать сразу
+    """
+    candidates = [backend for backend in backends if backend not in exclude]
+    available = [backend for backend in candidates if backend.available]
+    candidates = available or candidates
+    if not candidates:
+        return None
+    least = min(backend.outstanding for backend in candidates)
+    return random.choice([backend for backend in candidates if backend.outstanding == least])
+
+
+def _affine(key: str):
+    """
+    Бэкенд для ключа (rendezvous hashing): ключ не переезжает,
+    пока его бэкенд доступен. None, если доступных нет
+    """
+    available = [backend for backend in backends if backend.available]
+    if not available:
+        return None
+    return max(available, key=lambda backend: hashlib.sha256(f"{backend.url}\0{key}".encode()).digest())
+
+
+def _idempotency_key(body: bytes):
+    # тело разбирается, только если ключ в нём вообще есть
+    if b'"idempotency_key"' not in body:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("idempotency_key") is None:
+        return None
+    return f"{data.get('user_id')}\0{data['idempotency_key']}"
+
+
+async def _send(request: Request, path: str, backend: Backend = None, negotiate=True, affinity=None):
+    """
+    Отправляет запрос клиента на бэкенд (выбранный или заданный).
+    Возвращает (backend, ответ) с непрочитанным телом; после чтения нужно вызвать _close.
+    negotiate=False — запросить у бэкенда несжатый JSON, если диспетчер разбирает ответ сам
+    (в нужный клиенту формат его переведёт TransportMiddleware).
+    affinity — ключ, по которому выбирается бэкенд для первой попытки
+    """
+    body = await request.body()
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_HEADERS}
+    if not negotiate:
+        headers = {name: value for name, value in headers.items() if name.lower() not in NEGOTIATION_HEADERS}
+        headers["accept-encoding"] = "identity"
+    tried = []
+
+    for attempt in range(MAX_ATTEMPTS if backend is None else 1):
+        if backend is not None:
+            target = backend
+        elif affinity is not None and not tried:
+            target = _affine(affinity) or _choose(tried)
+        else:
+            target = _choose(tried)
+        if target is None:
+            break
+        tried.append(target)
+
+        target.outstanding += 1
+        upstream_request = client.build_request(
+            request.method,
+            target.url + path,
+            params=request.query_params,
+            headers=headers,
+            content=body
+        )
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # запрос до бэкенда не дошёл — можно повторить на другом
+            target.outstanding -= 1
+            target.failure()
+            continue
+        except httpx.HTTPError:
+            # бэкенд мог начать выполнение, повторять нельзя
+            target.outstanding -= 1
+            target.failure()
+            raise HTTPException(status_code=502, detail="Backend error")
+
+        # 503 — бэкенд запрос не принял (например, переполнена очередь заданий).
+        # Это не сбой: заполненный бэкенд исправен, выводить его из ротации нельзя
+        if upstream.status_code == 503:
+            if backend is None and attempt + 1 < MAX_ATTEMPTS:
+                await _close(target, upstream)
+                continue
+        elif upstream.status_code >= 500:
+            target.failure()
+        else:
+            target.success()
+        return target, upstream
+
+    raise HTTPException(status_code=503, detail="No backend available")
+
+
+async def _close(backend: Backend, upstream: httpx.Response):
+    backend.outstanding -= 1
+    await upstream.aclose()
+
+
+def _response_headers(upstream: httpx.Response):
+    return {name: value for name, value in upstream.headers.items() if name.lower() not in HOP_HEADERS}
+
+
+async def _check(backend: Backend):
+    started = time.monotonic()
+    try:
+        response = await client.get(backend.url + "/health", timeout=HEALTH_TIMEOUT)
+        healthy = response.status_code == 200
+    except httpx.HTTPError:
+        healthy = False
+    if healthy and time.monotonic() - started <= SLOW_THRESHOLD:
+        backend.success()
+    else:
+        backend.failure()
+
+
+async def _health_loop():
+    while True:
+        await asyncio.gather(*(_check(backend) for backend in backends))
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    # без таймаута на чтение: программы и long-poll могут работать долго
+    client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=CONNECT_TIMEOUT))
+    health_task = asyncio.create_task(_health_loop())
+    yield
+    health_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await health_task
+    await client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TransportMiddleware)
+
+
+@app.get("/health")
+async def health_endpoint():
+    """
+    Состояние бэкендов
+    """
+    return {
+        "status": "ok" if any(backend.available for backend in backends) else "unavailable",
+        "backends": [
+            {
+                "url": backend.url,
+                "available": backend.available,
+                "outstanding": backend.outstanding,
+                "failures": backend.failures,
+            }
+            for backend in backends
+        ],
+    }
+
+
+def _pinned(resource_id: str, detail: str):
+    """
+    (бэкенд, id на бэкенде) по id с номером бэкенда
+    """
+    index, _, backend_id = resource_id.partition("-")
+    if not index.isdigit() or int(index) >= len(backends):
+        raise HTTPException(status_code=404, detail=detail)
+    return backends[int(index)], backend_id
+
+
+def _pinned_response(backend: Backend, upstream: httpx.Response, content: bytes):
+    """
+    Добавляет к id задания или сессии номер бэкенда, на котором оно живёт
+    """
+    if upstream.is_success:
+        data = json.loads(content)
+        data["id"] = f"{backend.index}-{data['id']}"
+        content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return Response(content=content, status_code=upstream.status_code, media_type="application/json")
+
+
+@app.post("/jobs")
+async def submit_job_endpoint(request: Request):
+    backend, upstream = await _send(request, "/jobs", negotiate=False)
+    try:
+        content = await upstream.aread()
+    finally:
+        await _close(backend, upstream)
+    return _pinned_response(backend, upstream, content)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str, request: Request):
+    backend, backend_job_id = _pinned(job_id, "Job not found")
+    backend, upstream = await _send(request, f"/jobs/{backend_job_id}", backend=backend, negotiate=False)
+    try:
+        content = await upstream.aread()
+    finally:
+        await _close(backend, upstream)
+    return _pinned_response(backend, upstream, content)
+
+
+@app.post("/sessions")
+async def create_session_endpoint(request: Request):
+    backend, upstream = await _send(request, "/sessions", negotiate=False)
+    try:
+        content = await upstream.aread()
+    finally:
+        await _close(backend, upstream)
+    return _pinned_response(backend, upstream, content)
+
+
+@app.api_route("/sessions/{session_id}{path:path}", methods=["POST", "DELETE"])
+async def session_endpoint(session_id: str, path: str, request: Request):
+    """
+    Ячейки и закрытие сессии уходят на бэкенд, где живёт её интерпретатор
+    """
+    backend, backend_session_id = _pinned(session_id, "Session not found")
+    backend, upstream = await _send(
+        request, f"/sessions/{backend_session_id}{path}", backend=backend, negotiate=False
+    )
+    try:
+        content = await upstream.aread()
+    finally:
+        await _close(backend, upstream)
+    return Response(content=content, status_code=upstream.status_code, headers=_response_headers(upstream))
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "DELETE"])
+async def proxy_endpoint(path: str, request: Request):
+    """
+    Всё остальное (/run, /run/stream, /run/batch, /check, /task_checks, ...)
+    проксируется как есть, ответ передаётся потоком
+    """
+    affinity = None
+    if path == "run" and request.method == "POST":
+        affinity = _idempotency_key(await request.body())
+    backend, upstream = await _send(request, f"/{path}", affinity=affinity)
+
+    async def relay():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await _close(backend, upstream)
+
+    return StreamingResponse(relay(), status_code=upstream.status_code, headers=_response_headers(upstream))
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "dispatcher:app",
+        host="0.0.0.0",
+        port=int(os.getenv('PORT', 8000))
+    )
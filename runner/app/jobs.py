@@ -0,0 +1,111 @@
+"""
+Асинхронные задания: POST /jobs сразу возвращает id, результат забирается
+через GET /jobs/{id} (в том числе с long-polling)
+"""
+from collections import OrderedDict
+import asyncio
+import time
+import uuid
+
+
+class JobStoreFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued -> running -> done | error
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+        # место в очереди за слотом, пока задание его ждёт
+        self.ticket = None
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def queued(self, ticket):
+        self.ticket = ticket
+
+    def start(self):
+        self.status = "running"
+        self.ticket = None
+
+    def finish(self, result=None, error=None):
+        self.status = "error" if error is not None else "done"
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class JobStore:
+    """
+    Ограниченное хранилище заданий в памяти.
+    Завершённые задания живут ttl секунд; если места нет, первыми вытесняются
+    самые старые завершённые, а незавершённые не вытесняются никогда
+    """
+
+    def __init__(self, max_jobs=10000, ttl=600):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.ttl
+        ]:
+            del self._jobs[job_id]
+
+        if len(self._jobs) < self.max_jobs:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            del self._jobs[job_id]
+            if len(self._jobs) < self.max_jobs:
+                return
+
+    def submit(self, run):
+        """
+        Создаёт задание и запускает run(job) в фоне.
+        run — корутинная функция, возвращающая результат задания
+        """
+        self._expire()
+        if len(self._jobs) >= self.max_jobs:
+            raise JobStoreFull()
+
+        job = Job()
+        self._jobs[job.id] = job
+
+        async def execute():
+            try:
+                job.finish(result=await run(job))
+            except asyncio.CancelledError:
+                job.finish(error="Job cancelled")
+                raise
+            except Exception as err:
+                job.finish(error=str(err))
+
+        job.task = asyncio.create_task(execute())
+        return job
+
+    def get(self, job_id):
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def cancel_all(self):
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
@@ -1,23 +1,331 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from collections import Counter
+from typing import List, Optional
 import uvicorn
+import asyncio
+import json
+import math
 import os
+import sys
 
-from runner import run_code
-from models import RunPythonRequest
+from jobs import JobStore, JobStoreFull
+from runner import run_code, run_code_once, stream_code, run_batch, startup, shutdown, Limits, metrics, slot_pool, rate_limiter, \
+    MAX_BATCH_SIZE, MAX_JOBS, JOB_TTL, MAX_JOB_WAIT, EXERCISES_DIR, TASKS_RELOAD_INTERVAL
+from coalesce import IdempotencyConflict
+from scheduler import RateLimited
+from sessions import session_store, SessionsFull, SessionNotFound, SESSIONS_CHECK_INTERVAL
+from tasks import TaskIndex, etag_matches
+from transport import TransportMiddleware
+from models import RunPythonRequest, RunPythonResponse, BatchItemResponse, JobResponse, \
+    CheckRequest, CheckResponse, SessionRequest, SessionResponse, SessionRunRequest, SessionRunResponse
+from cupychecker.checker import check_result
 
-app = FastAPI()
+
+job_store = JobStore(max_jobs=MAX_JOBS, ttl=JOB_TTL)
+task_index = TaskIndex(EXERCISES_DIR)
+
+
+async def _reload_tasks():
+    while True:
+        await asyncio.sleep(TASKS_RELOAD_INTERVAL)
+        await asyncio.to_thread(task_index.refresh)
+
+
+async def _maintain_sessions():
+    while True:
+        await asyncio.sleep(SESSIONS_CHECK_INTERVAL)
+        await session_store.maintain()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(task_index.refresh)
+    if not len(task_index):
+        print(f"tasks: в {EXERCISES_DIR} нет ни одной задачи, /task_checks и /check будут отвечать 404",
+              file=sys.stderr)
+    reload_task = asyncio.create_task(_reload_tasks())
+    await startup()
+    await asyncio.to_thread(session_store.start)
+    sessions_task = asyncio.create_task(_maintain_sessions())
+    yield
+    for task in (reload_task, sessions_task):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    job_store.cancel_all()
+    await asyncio.to_thread(session_store.stop)
+    await shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TransportMiddleware)
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request, err: RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(err)},
+        headers={"Retry-After": str(math.ceil(err.retry_after))}
+    )
 
 
 @app.post("/run")
 async def run_code_endpoint(req: RunPythonRequest):
-    result = await run_code(req.code)
+    """
+    Запуск кода. Одновременные одинаковые запросы (с тем же idempotency_key
+    или, в детерминированном режиме, с тем же кодом) исполняются один раз
+    """
+    rate_limiter.check(req.user_id)
+    try:
+        result = await run_code_once(
+            req.code,
+            limits=Limits.from_request(req),
+            use_cache=req.cache is not False,
+            user_id=req.user_id,
+            course_id=req.course_id,
+            idempotency_key=req.idempotency_key
+        )
+    except IdempotencyConflict as err:
+        raise HTTPException(status_code=409, detail=str(err))
     return result
 
 
+@app.post("/run/stream")
+async def run_code_stream_endpoint(req: RunPythonRequest):
+    """
+    Запуск кода с выдачей вывода через Server-Sent Events:
+    событие queued с местом в очереди и оценкой ожидания, если слот занят,
+    события stdout/stderr с кусками вывода и финальное событие result
+    с кодом возврата и признаком таймаута (без stdout/stderr — они уже отправлены)
+    """
+    rate_limiter.check(req.user_id)
+
+    async def events():
+        async for name, payload in stream_code(
+            req.code,
+            limits=Limits.from_request(req),
+            use_cache=req.cache is not False,
+            user_id=req.user_id,
+            course_id=req.course_id
+        ):
+            if name == "result":
+                data = payload.model_dump(exclude={"stdout", "stderr"})
+            elif name == "queued":
+                data = payload
+            else:
+                data = {"text": payload}
+            yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _admit_batch(reqs: List[RunPythonRequest]):
+    if len(reqs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+    for user_id, count in Counter(req.user_id for req in reqs).items():
+        rate_limiter.check(user_id, cost=count)
+
+
+@app.post("/run/batch", response_model=List[RunPythonResponse])
+async def run_batch_endpoint(reqs: List[RunPythonRequest]):
+    """
+    Запуск набора программ за один запрос. Программы распределяются
+    по свободным слотам, результаты возвращаются в порядке запроса
+    """
+    _admit_batch(reqs)
+    results = [None] * len(reqs)
+    async for index, result in run_batch(reqs):
+        results[index] = result
+    return results
+
+
+@app.post("/run/batch/stream")
+async def run_batch_stream_endpoint(reqs: List[RunPythonRequest]):
+    """
+    То же, что /run/batch, но результаты отправляются через Server-Sent Events
+    по мере завершения: событие result с полем index на каждую программу
+    и событие done в конце
+    """
+    _admit_batch(reqs)
+
+    async def events():
+        async for index, result in run_batch(reqs):
+            data = BatchItemResponse(index=index, **result.model_dump()).model_dump()
+            yield f"event: result\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _job_response(job):
+    response = JobResponse(id=job.id, status=job.status, result=job.result, error=job.error)
+    if job.ticket is not None:
+        response.queue_position, response.estimated_wait = slot_pool.queue_info(job.ticket)
+    return response
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job_endpoint(req: RunPythonRequest):
+    """
+    Постановка программы в очередь. Возвращает id задания сразу,
+    не дожидаясь запуска
+    """
+    rate_limiter.check(req.user_id)
+
+    async def run(job):
+        return await run_code(
+            req.code,
+            limits=Limits.from_request(req),
+            use_cache=req.cache is not False,
+            on_start=job.start,
+            on_queued=job.queued,
+            user_id=req.user_id,
+            course_id=req.course_id
+        )
+
+    try:
+        job = job_store.submit(run)
+    except JobStoreFull:
+        raise HTTPException(status_code=503, detail="Too many jobs")
+    return _job_response(job)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_endpoint(job_id: str, wait: float = Query(default=0, ge=0)):
+    """
+    Состояние задания. С параметром wait ждёт завершения до wait секунд
+    (не больше RUNNER__MAX_JOB_WAIT) и отвечает сразу, как только оно завершится
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait and not job.finished:
+        await job.wait(min(wait, MAX_JOB_WAIT))
+    return _job_response(job)
+
+
+@app.post("/sessions", response_model=SessionResponse, status_code=201)
+async def create_session_endpoint(req: SessionRequest):
+    """
+    Запуск интерпретатора, который сохраняет переменные и импорты между
+    ячейками (POST /sessions/{id}/run), пока сессию не закроют или она
+    не простоит дольше RUNNER__SESSION_IDLE_TIMEOUT
+    """
+    rate_limiter.check(req.user_id)
+    try:
+        session = await session_store.create(
+            Limits(memory=req.memory),
+            user_id=req.user_id,
+            course_id=req.course_id
+        )
+    except SessionsFull as err:
+        raise HTTPException(status_code=503, detail=str(err))
+    return SessionResponse(id=session.id, idle_timeout=session_store.idle_timeout)
+
+
+@app.post("/sessions/{session_id}/run", response_model=SessionRunResponse)
+async def run_session_endpoint(session_id: str, req: SessionRunRequest):
+    """
+    Исполнение ячейки в сессии. Если интерпретатор завершился или ячейку
+    не удалось прервать по таймауту, сессия закрывается (session_alive: false)
+    """
+    try:
+        session = session_store.get(session_id)
+        rate_limiter.check(session.user_id)
+        return await session_store.run(
+            session_id,
+            req.code,
+            Limits(
+                timeout=req.timeout,
+                max_stdout_size=req.max_stdout_size,
+                max_stderr_size=req.max_stderr_size,
+                memory=session.limits.memory
+            )
+        )
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@app.delete("/sessions/{session_id}", status_code=204)
+async def close_session_endpoint(session_id: str):
+    try:
+        await session_store.close(session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return Response(status_code=204)
+
+
+@app.get("/task_checks")
+async def task_checks_endpoint(
+    module: str,
+    task: str,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Проверки задачи в формате {"data": ...}. Ответ отдаётся из памяти;
+    с заголовком If-None-Match и совпавшим ETag — 304 без тела
+    """
+    entry = task_index.get(module, task)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+@app.post("/check", response_model=CheckResponse)
+async def check_endpoint(req: CheckRequest):
+    """
+    Запуск кода и проверка результата по проверкам задачи за один запрос.
+    Проверки выполняет тот же check_result, что и в cupychecker
+    """
+    entry = task_index.get(req.module, req.task)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    rate_limiter.check(req.user_id)
+    result = await run_code(
+        req.code,
+        limits=Limits.from_request(req),
+        use_cache=req.cache is not False,
+        user_id=req.user_id,
+        course_id=req.course_id
+    )
+    # как и в magic %%run: программа с ошибкой или таймаутом проверки не проходит
+    if result.timeout or result.stderr != "":
+        return CheckResponse(passed=False, message=result.stderr, result=result)
+
+    verdict = await asyncio.to_thread(check_result, req.code, result.stdout, entry.data)
+    if verdict is True:
+        return CheckResponse(passed=True, result=result)
+    return CheckResponse(passed=False, message=str(verdict), result=result)
+
+
+@app.get("/health")
+async def health_endpoint():
+    """
+    Проверка живости для балансировщика (см. dispatcher.py)
+    """
+    return {"status": "ok", "in_flight": slot_pool.busy, "queued": slot_pool.waiting}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Метрики в текстовом формате Prometheus
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=int(os.getenv('PORT', 8000)),
         reload=True
-    )
\ No newline at end of file
+    )
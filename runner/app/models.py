@@ -1,9 +1,78 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 
 class RunPythonRequest(BaseModel):
     code: str
+    # Ограничения запуска; не могут превышать настройки сервера
+    timeout: Optional[float] = Field(default=None, gt=0)
+    max_stdout_size: Optional[int] = Field(default=None, ge=0)
+    max_stderr_size: Optional[int] = Field(default=None, ge=0)
+    # Процессорное время в секундах и адресное пространство в байтах
+    cpu_time: Optional[float] = Field(default=None, gt=0)
+    memory: Optional[int] = Field(default=None, gt=0)
+    # False — не брать результат из кэша (если кэш включён на сервере)
+    cache: Optional[bool] = None
+    # Собирать графики matplotlib/plotly и вернуть их в artifacts (matplotlib — в этом формате)
+    plots: Optional[Literal["png", "svg"]] = None
+    # Вернуть профиль: самые долгие импорты и функции (программа работает чуть медленнее)
+    profile: Optional[bool] = None
+    # Кто запускает: по ним слоты делятся поровну между пользователями и курсами,
+    # к пользователю применяются ограничения на число запусков
+    user_id: Optional[str] = None
+    course_id: Optional[str] = None
+    # Ключ идемпотентности (/run): запросы пользователя с тем же ключом получают
+    # результат одного запуска, в том числе повторы вскоре после его завершения
+    idempotency_key: Optional[str] = Field(default=None, max_length=255)
+
+
+class Artifact(BaseModel):
+    name: str
+    # image/png, image/svg+xml или application/vnd.plotly.v1+json
+    mime_type: str
+    sha256: str
+    size: int
+    # содержимое в base64
+    data: str
+
+
+class SyntaxErrorInfo(BaseModel):
+    # Позиция ошибки как у SyntaxError: строки и столбцы с единицы
+    line: Optional[int] = None
+    offset: Optional[int] = None
+    end_line: Optional[int] = None
+    end_offset: Optional[int] = None
+    message: str
+    # Строка кода с ошибкой
+    text: Optional[str] = None
+
+
+class ImportTiming(BaseModel):
+    module: str
+    # Время импорта в секундах с вложенными импортами и без них
+    cumulative_time: float
+    self_time: float
+
+
+class FunctionTiming(BaseModel):
+    # Имя функции (<module> — код модуля), файл и строка её начала
+    function: str
+    file: str
+    line: int
+    # Процессорное время в самой функции без вызванных из неё функций на Python
+    self_time: float
+    samples: int
+
+
+class Profile(BaseModel):
+    # Всё время, ушедшее на импорты, в секундах
+    import_time: float
+    # Самые долгие импорты и функции, по убыванию времени
+    imports: List[ImportTiming]
+    functions: List[FunctionTiming]
+    # Период сэмплирования функций (по процессорному времени) и число сэмплов
+    sample_interval: float
+    samples: int
 
 
 class RunPythonResponse(BaseModel):
@@ -11,3 +80,83 @@ class RunPythonResponse(BaseModel):
     stderr: str
     return_code: Optional[int] = None
     timeout: Optional[bool] = None
+    # Результат взят из кэша; None, если кэш выключен
+    cached: Optional[bool] = None
+    # Результат получен запуском другого такого же запроса (см. coalesce.py)
+    coalesced: Optional[bool] = None
+    # Вывод обрезан по max_stdout_size/max_stderr_size; полный объём вывода в байтах
+    stdout_truncated: Optional[bool] = None
+    stderr_truncated: Optional[bool] = None
+    stdout_bytes: Optional[int] = None
+    stderr_bytes: Optional[int] = None
+    # Потребление ресурсов: процессорное время (с), пиковый RSS (байты), время работы (с)
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+    wall_time: Optional[float] = None
+    # Какое ограничение сработало: timeout, cpu_time, memory, processes или file_size
+    limit_exceeded: Optional[str] = None
+    # Графики, если они запрошены (plots); одинаковые возвращаются один раз.
+    # artifacts_truncated — часть не поместилась в RUNNER__MAX_ARTIFACTS_SIZE
+    artifacts: Optional[List[Artifact]] = None
+    artifacts_truncated: Optional[bool] = None
+    # Профиль, если он запрошен (profile) и программа успела завершиться
+    profile: Optional[Profile] = None
+    # Код не компилируется: программа не запускалась, stderr — как у python3
+    syntax_error: Optional[SyntaxErrorInfo] = None
+
+
+class CheckRequest(RunPythonRequest):
+    # Задача из дерева упражнений (module_X/tasks/task_Y.yaml)
+    module: str
+    task: str
+
+
+class CheckResponse(BaseModel):
+    # Прошёл ли код все проверки задачи
+    passed: bool
+    # Причина провала: сообщение проверки, stderr программы или таймаут
+    message: Optional[str] = None
+    result: RunPythonResponse
+
+
+class BatchItemResponse(RunPythonResponse):
+    # Позиция программы в запросе /run/batch
+    index: int
+
+
+class JobResponse(BaseModel):
+    id: str
+    # queued, running, done или error
+    status: str
+    result: Optional[RunPythonResponse] = None
+    error: Optional[str] = None
+    # Для ждущего слот задания: оценка места в очереди (1 — следующее) и ожидания в секундах
+    queue_position: Optional[int] = None
+    estimated_wait: Optional[float] = None
+
+
+class SessionRequest(BaseModel):
+    # Адресное пространство интерпретатора сессии в байтах (на всю сессию)
+    memory: Optional[int] = Field(default=None, gt=0)
+    user_id: Optional[str] = None
+    course_id: Optional[str] = None
+
+
+class SessionResponse(BaseModel):
+    id: str
+    # Сессия закрывается, если в ней ничего не запускали дольше idle_timeout секунд
+    idle_timeout: float
+
+
+class SessionRunRequest(BaseModel):
+    code: str
+    # Ограничения одной ячейки
+    timeout: Optional[float] = Field(default=None, gt=0)
+    max_stdout_size: Optional[int] = Field(default=None, ge=0)
+    max_stderr_size: Optional[int] = Field(default=None, ge=0)
+
+
+class SessionRunResponse(RunPythonResponse):
+    # False — интерпретатор завершился или не уложился в таймаут, сессия закрыта
+    session_alive: bool
@@ -0,0 +1,86 @@
+"""
+Чтение stdout/stderr программы студента
+"""
+import os
+import selectors
+import time
+
+
+class PipeReader:
+    """
+    Вычитывает stdout/stderr до закрытия обоих каналов.
+    Вывод сверх limits отбрасывается, но канал продолжает вычитываться,
+    чтобы программа не упёрлась в заполненный pipe.
+    on_output(name, chunk) вызывается для каждого сохранённого куска вывода.
+    В sizes — сколько байт программа вывела всего, включая отброшенное
+    """
+
+    def __init__(self, stdout_fd, stderr_fd, limits=(None, None), on_output=None):
+        self.stdout = bytearray()
+        self.stderr = bytearray()
+        self.sizes = {'stdout': 0, 'stderr': 0}
+        self._streams = {
+            stdout_fd: ('stdout', self.stdout, limits[0]),
+            stderr_fd: ('stderr', self.stderr, limits[1]),
+        }
+        self._on_output = on_output
+        self._stopped = False
+        self._selector = selectors.DefaultSelector()
+        for fd in self._streams:
+            self._selector.register(fd, selectors.EVENT_READ)
+
+    def add(self, fileobj, callback):
+        """
+        Дополнительный источник событий (например, канал управления зиготы).
+        callback(fileobj) возвращает True, когда источник больше не нужен
+        """
+        self._selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def stop(self):
+        """
+        Завершает read() раньше закрытия каналов, дочитав уже записанный вывод.
+        Вызывается из callback (например, когда ячейка сессии закончилась)
+        """
+        self._stopped = True
+
+    def read(self, deadline=None):
+        """
+        Читает, пока все источники не закроются или не вызван stop().
+        Возвращает False, если наступил deadline (по time.monotonic()), иначе True
+        """
+        while self._selector.get_map():
+            wait = None
+            if self._stopped:
+                wait = 0
+            elif deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return False
+
+            ready = self._selector.select(wait)
+            if self._stopped and not any(key.data is None for key, _ in ready):
+                self._stopped = False
+                return True
+            for key, _ in ready:
+                if key.data is not None:
+                    if key.data(key.fileobj):
+                        self._selector.unregister(key.fileobj)
+                    continue
+
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    self._selector.unregister(key.fd)
+                    continue
+
+                name, output, limit = self._streams[key.fd]
+                self.sizes[name] += len(chunk)
+                if limit is not None:
+                    chunk = chunk[:max(limit - len(output), 0)]
+                if chunk:
+                    output += chunk
+                    if self._on_output is not None:
+                        self._on_output(name, bytes(chunk))
+        return True
+
+    def close(self):
+        self._selector.close()
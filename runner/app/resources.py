@@ -0,0 +1,50 @@
+"""
+Лимиты ресурсов (rlimit) и учёт потребления для программ студентов
+"""
+import os
+import resource
+
+
+def apply_rlimits(rlimits):
+    """
+    Устанавливает лимиты текущему процессу. rlimits — словарь
+    {"RLIMIT_CPU": [soft, hard], ...}, его можно передать через JSON
+    """
+    for name, (soft, hard) in rlimits.items():
+        resource.setrlimit(getattr(resource, name), (soft, hard))
+
+
+def usage_from_rusage(rusage):
+    """
+    Потребление из результата os.wait4: процессорное время в секундах
+    и пиковый RSS в байтах (в Linux ru_maxrss считается в килобайтах)
+    """
+    return {
+        "user_time": round(rusage.ru_utime, 4),
+        "system_time": round(rusage.ru_stime, 4),
+        "max_rss": rusage.ru_maxrss * 1024,
+    }
+
+
+def usage_from_proc(pid):
+    """
+    То же для живого процесса (по /proc): время с учётом дождавшихся потомков
+    и пиковый RSS. Пустой словарь, если процесса уже нет
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+    except (FileNotFoundError, ProcessLookupError):
+        return {}
+    ticks = os.sysconf("SC_CLK_TCK")
+    # после ")" поля считаются с третьего: utime — 14-е, stime — 15-е, cutime и cstime — за ними
+    utime, stime, cutime, cstime = (int(value) for value in fields[11:15])
+    return {
+        "user_time": round((utime + cutime) / ticks, 4),
+        "system_time": round((stime + cstime) / ticks, 4),
+        "max_rss": int(status.get("VmHWM", "0 kB").split()[0]) * 1024,
+        "rss": int(status.get("VmRSS", "0 kB").split()[0]) * 1024,
+    }
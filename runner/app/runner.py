@@ -1,64 +1,901 @@
 import subprocess
 import asyncio
-from tempfile import TemporaryDirectory
+import codecs
+import errno
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from functools import partial
+import math
 import os
+import pwd
+import shutil
+import signal
+import sys
+import time
+import traceback
 
-from models import RunPythonResponse
-
-
-MAX_STDOUT_SIZE = os.getenv('RUNNER__MAX_STDOUT_SIZE', 1000)
-MAX_STDERR_SIZE = os.getenv('RUNNER__MAX_STDERR_SIZE', 1000)
-TIMEOUT = os.getenv('RUNNER__TIMEOUT', 30)
-
-run_lock = asyncio.Lock()
-
-
-async def run_code(code):
-
-    async with run_lock:
-        # создаём временную директорию для файлов студента
-        home_dir = os.path.join("home", "student")
-        os.makedirs(home_dir, exist_ok=True)
-
-        with TemporaryDirectory(dir=home_dir) as tmpdir:
-            code_file = os.path.join(tmpdir, "main.py")
-
-            # сохраняем код в main.py
-            with open(code_file, "w") as f:
-                f.write(code)
-
-            command = f"python3 {code_file}"
-            try:
-                proc = subprocess.run(
-                    f"(cd {tmpdir} && chown -R student {tmpdir} && ln -s ../../../datasets datasets"
-                    f"&& su -m student -c \'{command}\')"
-                    f"> >(head -c {MAX_STDOUT_SIZE}) "
-                    f"2> >(head -c {MAX_STDERR_SIZE} >&2)",
-                    capture_output=True,
-                    timeout=TIMEOUT,
-                    shell=True,
-                    executable="/bin/bash",
-                    env={"MPLCONFIGDIR": tmpdir}
-                )
-                stdout = proc.stdout.decode("utf-8", errors="ignore")
-                stderr = proc.stderr.decode("utf-8", errors="ignore")
-                return_code = proc.returncode
-
-                return RunPythonResponse(
-                    stdout=stdout,
-                    stderr=stderr,
-                    return_code=return_code,
-                    timeout=False
-                    )
-
-            except subprocess.TimeoutExpired:
-                return RunPythonResponse(
-                    stdout="",
-                    stderr="Execution timed out",
-                    return_code=None,
-                    timeout=True
-                    )
-
-            finally:
-                # убиваем все процессы студента (безопасная очистка окружения)
-                subprocess.call("killall -s 9 -u student", shell=True)
+from pydantic import ValidationError
+
+import artifacts
+from cgroup import Cgroup, kill_user_processes
+from cache import DatasetsVersion, ResultCache, interpreter_fingerprint
+from coalesce import Coalescer
+from metrics import Registry
+from models import Profile, RunPythonResponse, SyntaxErrorInfo
+from output import PipeReader
+from workspace import TMP_DIRECTORY, WorkspacePool, remove_user_files
+from resources import apply_rlimits, usage_from_rusage
+from scheduler import FairQueue, RateLimiter, parse_weights
+from tasks import package_root
+from zygote import Zygote
+
+
+MAX_STDOUT_SIZE = int(os.getenv('RUNNER__MAX_STDOUT_SIZE', 1000))
+MAX_STDERR_SIZE = int(os.getenv('RUNNER__MAX_STDERR_SIZE', 1000))
+TIMEOUT = float(os.getenv('RUNNER__TIMEOUT', 30))
+# Ограничения ресурсов одного запуска (setrlimit): процессорное время в секундах,
+# адресное пространство и размер файла в байтах, число процессов и потоков пользователя слота.
+# Лимит CPU меньше таймаута: счётная программа упирается в него, а не в таймаут
+CPU_TIME = float(os.getenv('RUNNER__CPU_TIME', TIMEOUT * 0.8))
+MEMORY_LIMIT = int(os.getenv('RUNNER__MEMORY_LIMIT', 4 * 1024 ** 3))
+MAX_PROCESSES = int(os.getenv('RUNNER__MAX_PROCESSES', 64))
+MAX_FILE_SIZE = int(os.getenv('RUNNER__MAX_FILE_SIZE', 100 * 1024 * 1024))
+# Проверять синтаксис до запуска; выключается, если интерпретатор программ новее, чем у runner
+SYNTAX_CHECK = os.getenv('RUNNER__SYNTAX_CHECK', '1') == '1'
+# Код больше этого (в символах) проверяет сам интерпретатор программы: компиляция
+# держит GIL и на мегабайтах кода надолго останавливает event loop
+SYNTAX_CHECK_MAX_SIZE = int(os.getenv('RUNNER__SYNTAX_CHECK_MAX_SIZE', 256 * 1024))
+# Суммарный объём графиков (артефактов) одного запуска в байтах
+MAX_ARTIFACTS_SIZE = int(os.getenv('RUNNER__MAX_ARTIFACTS_SIZE', 2 * 1024 * 1024))
+# Сколько секунд после SIGTERM по таймауту программа может дописать вывод до SIGKILL
+KILL_GRACE = float(os.getenv('RUNNER__KILL_GRACE', 1))
+# Потоков у OpenBLAS/OpenMP на одну программу: иначе каждая программа
+# занимает все ядра, а пулы потоков съедают лимит адресного пространства
+THREADS_PER_RUN = os.getenv('RUNNER__THREADS_PER_RUN', '1')
+# Количество параллельных слотов; для каждого слота в образе заведён
+# пользователь student1..studentN (см. Dockerfile)
+SLOTS = int(os.getenv('RUNNER__SLOTS', 4))
+# Справедливая очередь (см. scheduler.py): сколько программ одного пользователя
+# исполняются одновременно (0 — без ограничения), веса курсов ("course_a=2,course_b=1")
+# и token bucket на пользователя: запусков в секунду (0 — без ограничения) и запас
+MAX_RUNS_PER_USER = int(os.getenv('RUNNER__MAX_RUNS_PER_USER', 2))
+COURSE_WEIGHTS = parse_weights(os.getenv('RUNNER__COURSE_WEIGHTS', ''))
+USER_RATE = float(os.getenv('RUNNER__USER_RATE', 0))
+USER_BURST = float(os.getenv('RUNNER__USER_BURST', 10))
+# subprocess — каждый запуск в новом интерпретаторе от имени пользователя слота,
+# zygote — fork от процесса с заранее импортированными библиотеками (см. zygote.py)
+MODE = os.getenv('RUNNER__MODE', 'subprocess')
+# Интерпретатор для режима subprocess; в окружении программы нет PATH, поэтому путь ищется заранее
+PYTHON = os.getenv('RUNNER__PYTHON') or shutil.which('python3') or sys.executable
+# Максимальное количество программ в одном запросе /run/batch
+MAX_BATCH_SIZE = int(os.getenv('RUNNER__MAX_BATCH_SIZE', 1000))
+# Асинхронные задания (/jobs): ёмкость хранилища, время жизни результата
+# и максимальное время ожидания одного long-poll запроса
+MAX_JOBS = int(os.getenv('RUNNER__MAX_JOBS', 10000))
+JOB_TTL = float(os.getenv('RUNNER__JOB_TTL', 600))
+MAX_JOB_WAIT = float(os.getenv('RUNNER__MAX_JOB_WAIT', 30))
+# Дерево упражнений module_X/tasks/task_Y.yaml для /task_checks (см. tasks.py),
+# по умолчанию из установленного пакета cupychecker, и период проверки файлов на изменения в секундах
+EXERCISES_DIR = os.getenv('RUNNER__EXERCISES_DIR') or package_root() or 'exercises'
+TASKS_RELOAD_INTERVAL = float(os.getenv('RUNNER__TASKS_RELOAD_INTERVAL', 2))
+# Кэш результатов (см. cache.py); включение кэша включает и детерминированный режим
+CACHE = os.getenv('RUNNER__CACHE', '0') == '1'
+CACHE_DIR = os.getenv('RUNNER__CACHE_DIR', 'cache')
+CACHE_MEMORY_ITEMS = int(os.getenv('RUNNER__CACHE_MEMORY_ITEMS', 1024))
+CACHE_TTL = float(os.getenv('RUNNER__CACHE_TTL', 86400))
+CACHE_DISK_SIZE = int(os.getenv('RUNNER__CACHE_DISK_SIZE', 100 * 1024 * 1024))
+# Детерминированный режим: фиксированные PYTHONHASHSEED и seed у random/numpy
+DETERMINISTIC = os.getenv('RUNNER__DETERMINISTIC', '1' if CACHE else '0') == '1'
+# Сколько секунд завершённый результат отдаётся повторам того же запроса (см. coalesce.py)
+COALESCE_RETENTION = float(os.getenv('RUNNER__COALESCE_RETENTION', 30))
+
+DATASETS_DIR = "datasets"
+# Разобранные заранее датасеты (см. sandbox/datastore.py)
+DATASTORE = os.getenv('RUNNER__DATASTORE', '1') == '1'
+DATASTORE_DIR = os.path.abspath(os.getenv('RUNNER__DATASTORE_DIR', 'datastore'))
+# Рабочие директории программ (см. workspace.py); лучше всего tmpfs с ограничением размера
+WORKSPACE_DIR = os.getenv('RUNNER__WORKSPACE_DIR', 'home')
+WORKSPACES_PER_SLOT = int(os.getenv('RUNNER__WORKSPACES_PER_SLOT', 2))
+# Каталог cgroup v2, в котором создаются cgroup слотов (см. cgroup.py)
+CGROUP_ROOT = os.getenv('RUNNER__CGROUP_ROOT', '/sys/fs/cgroup/pyrunner')
+# Каталог с модулями для программ студентов: sitecustomize.py и datastore.py
+SANDBOX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox")
+# Профиль программы (см. sandbox/profiler.py) в её рабочей директории
+PROFILE_FILE = ".profile.json"
+MAX_PROFILE_SIZE = 64 * 1024
+
+
+class Limits:
+    """
+    Ограничения одного запуска. Значения из запроса не могут превышать настройки сервера
+    """
+
+    def __init__(self, timeout=None, max_stdout_size=None, max_stderr_size=None, cpu_time=None, memory=None,
+                 plots=None, profile=False):
+        self.timeout = min(timeout, TIMEOUT) if timeout is not None else TIMEOUT
+        self.max_stdout_size = min(max_stdout_size, MAX_STDOUT_SIZE) \
+            if max_stdout_size is not None else MAX_STDOUT_SIZE
+        self.max_stderr_size = min(max_stderr_size, MAX_STDERR_SIZE) \
+            if max_stderr_size is not None else MAX_STDERR_SIZE
+        if cpu_time is None:
+            # с меньшим таймаутом лимит CPU уменьшается в той же пропорции
+            cpu_time = self.timeout * CPU_TIME / TIMEOUT
+        self.cpu_time = min(cpu_time, CPU_TIME)
+        self.memory = min(memory, MEMORY_LIMIT) if memory is not None else MEMORY_LIMIT
+        self.max_processes = MAX_PROCESSES
+        self.max_file_size = MAX_FILE_SIZE
+        # формат графиков (png или svg); None — графики не собираются
+        self.plots = plots
+        self.max_artifacts_size = MAX_ARTIFACTS_SIZE if plots is not None else 0
+        self.profile = bool(profile)
+
+    @classmethod
+    def from_request(cls, req):
+        return cls(
+            timeout=req.timeout,
+            max_stdout_size=req.max_stdout_size,
+            max_stderr_size=req.max_stderr_size,
+            cpu_time=req.cpu_time,
+            memory=req.memory,
+            plots=req.plots,
+            profile=req.profile
+        )
+
+    def rlimits(self):
+        """
+        Лимиты для resources.apply_rlimits. По мягкому лимиту CPU ядро шлёт SIGXCPU,
+        жёсткий на секунду больше — на случай, если сигнал перехвачен
+        """
+        cpu_time = math.ceil(self.cpu_time)
+        return {
+            "RLIMIT_CPU": [cpu_time, cpu_time + 1],
+            "RLIMIT_AS": [self.memory, self.memory],
+            "RLIMIT_NPROC": [self.max_processes, self.max_processes],
+            "RLIMIT_FSIZE": [self.max_file_size, self.max_file_size],
+        }
+
+
+class Execution:
+    """
+    Итог одного запуска программы
+    """
+
+    def __init__(self):
+        self.stdout = b""
+        self.stderr = b""
+        # полный объём вывода, включая отброшенное сверх лимитов
+        self.output_sizes = {"stdout": 0, "stderr": 0}
+        self.returncode = None
+        self.timed_out = False
+        # user_time, system_time, max_rss (см. resources.usage_from_rusage)
+        self.usage = {}
+        # момент запуска программы (time.monotonic()) и время её работы
+        self.started = None
+        self.wall_time = None
+        # графики (см. artifacts.collect) и признак того, что часть не влезла в лимит
+        self.artifacts = None
+        self.artifacts_truncated = None
+        # models.Profile, если профиль запрошен и программа успела его записать
+        self.profile = None
+        # прирост счётчиков cgroup слота за время запуска (см. Slot.events)
+        self.events = {}
+
+    def limit_exceeded(self, limits: Limits):
+        """
+        Какое ограничение сработало, или None.
+        Программа, убитая сигналом N, завершается с кодом -N, а если сигнал
+        перехватил sitecustomize (SIGTERM, SIGXCPU) — с кодом 128 + N
+        """
+        cpu_time = self.usage.get("user_time", 0) + self.usage.get("system_time", 0)
+        # RLIMIT_CPU округляется вверх до секунды, и дедлайн может сработать раньше:
+        # программа, которая выбрала лимит CPU, остановлена по нему, а не по таймауту
+        if self.timed_out:
+            return "cpu_time" if cpu_time >= limits.cpu_time else "timeout"
+        signum = None
+        if self.returncode is not None and self.returncode < 0:
+            signum = -self.returncode
+        elif self.returncode is not None and self.returncode > 128:
+            signum = self.returncode - 128
+
+        if signum == signal.SIGXCPU or (signum == signal.SIGKILL and cpu_time >= limits.cpu_time):
+            return "cpu_time"
+        if signum == signal.SIGXFSZ:
+            return "file_size"
+        # ядро убило процесс OOM killer или отказало в fork по pids.max
+        if self.events.get("oom_kill"):
+            return "memory"
+        if self.events.get("pids_max"):
+            return "processes"
+        # Отказы по rlimits Python превращает в исключения, а не в сигналы.
+        # Их видно только по последней строке трассировки упавшей программы
+        if signum is None and self.returncode:
+            return _limit_error(self.stderr)
+        return None
+
+    @property
+    def stdout_truncated(self):
+        return self.output_sizes["stdout"] > len(self.stdout)
+
+    @property
+    def stderr_truncated(self):
+        return self.output_sizes["stderr"] > len(self.stderr)
+
+
+def _limit_error(stderr: bytes):
+    """
+    Ограничение по исключению, которым завершилась программа, или None.
+    Смотрится только последняя строка трассировки — то, что программа напечатала сама, не в счёт
+    """
+    if b"Traceback (most recent call last):" not in stderr:
+        return None
+    lines = stderr.rstrip().rsplit(b"\n", 1)
+    name, _, message = lines[-1].strip().partition(b":")
+    # MemoryError, а также numpy ..._ArrayMemoryError
+    if name.endswith(b"MemoryError"):
+        return "memory"
+    if name == b"BlockingIOError" and f"[Errno {errno.EAGAIN}]".encode() in message:
+        return "processes"
+    if name == b"RuntimeError" and b"can't start new thread" in message:
+        return "processes"
+    # Python игнорирует SIGXFSZ, запись сверх лимита падает с EFBIG
+    if name == b"OSError" and f"[Errno {errno.EFBIG}]".encode() in message:
+        return "file_size"
+    return None
+
+
+class Slot:
+    """
+    Изолированный слот исполнения: свой Unix-пользователь и своя домашняя директория
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.user = f"student{index}"
+        self.uid = None
+        self.gid = None
+        # cgroup слота; None, если cgroup v2 недоступна
+        self.cgroup = None
+        # число процессов ограничивает pids.max cgroup, а не RLIMIT_NPROC
+        self.pids_limited = False
+        # процесс, который сейчас исполняется в слоте (Popen или ZygoteProcess)
+        self.process = None
+
+    def kill(self, signum=signal.SIGKILL):
+        """
+        Посылает сигнал текущей программе слота вместе со всеми её потомками.
+        Программа запускается в своей сессии, поэтому pgid == pid
+        """
+        process = self.process
+        if process is None:
+            return
+        with suppress(ProcessLookupError):
+            os.killpg(process.pid, signum)
+
+    def setup(self):
+        entry = pwd.getpwnam(self.user)
+        self.uid, self.gid = entry.pw_uid, entry.pw_gid
+        self.cgroup = Cgroup.create(CGROUP_ROOT, f"slot{self.index}")
+        self.pids_limited = self.cgroup is not None and self.cgroup.set("pids.max", MAX_PROCESSES)
+
+    def rlimits(self, limits: Limits):
+        """
+        Лимиты запуска в слоте. Если число процессов ограничивает pids.max cgroup,
+        RLIMIT_NPROC не ставится: отказ в fork по pids.max виден в pids.events,
+        а пользователь слота живёт только в этой cgroup
+        """
+        rlimits = limits.rlimits()
+        if self.pids_limited:
+            del rlimits["RLIMIT_NPROC"]
+        return rlimits
+
+    def events(self):
+        """
+        Счётчики срабатываний лимитов ядром: OOM-убийства и отказы в fork.
+        Счётчики накопительные, поэтому запуск сравнивает значения до и после
+        """
+        if self.cgroup is None:
+            return {}
+        return {
+            "oom_kill": self.cgroup.events("memory").get("oom_kill", 0),
+            "pids_max": self.cgroup.events("pids").get("max", 0),
+        }
+
+    def cleanup(self):
+        """
+        Убивает все процессы, оставшиеся после запуска, в том числе
+        сменившие группу процессов через setsid, и удаляет их файлы из /tmp
+        """
+        if self.cgroup is not None:
+            self.cgroup.kill()
+        else:
+            kill_user_processes(self.uid)
+        # файлы в /tmp следующий запуск в слоте видеть не должен
+        remove_user_files(self.uid)
+
+
+class SlotPool:
+    """
+    Пул слотов исполнения. Каждый запуск занимает свободный слот,
+    пока свободных нет — запрос ждёт в справедливой очереди
+    """
+
+    def __init__(self, size: int, max_per_user=0, course_weights=None):
+        self.size = size
+        self.slots = [Slot(index) for index in range(1, size + 1)]
+        self._queue = FairQueue(self.slots, max_per_user=max_per_user, course_weights=course_weights)
+
+    @property
+    def busy(self):
+        return self._queue.busy
+
+    @property
+    def waiting(self):
+        # сколько запросов ждут слот
+        return self._queue.waiting
+
+    def queue_info(self, ticket):
+        """
+        (место в очереди, оценка ожидания в секундах) для ждущего запроса
+        """
+        return self._queue.position(ticket), self._queue.estimated_wait(ticket)
+
+    @asynccontextmanager
+    async def acquire(self, user_id=None, course_id=None, on_queued=None):
+        """
+        on_queued(ticket) вызывается, если свободного слота нет и запрос встал в очередь
+        """
+        queued_at = time.monotonic()
+        ticket = self._queue.enqueue(user_id, course_id)
+        if not ticket.ready and on_queued is not None:
+            on_queued(ticket)
+        slot = await self._queue.wait(ticket)
+        started = time.monotonic()
+        queue_wait_seconds.observe(started - queued_at)
+        try:
+            yield slot
+        finally:
+            self._queue.release(slot, ticket, time.monotonic() - started)
+
+
+metrics = Registry()
+submissions_total = metrics.counter("runner_submissions_total", "Programs submitted, including cache hits")
+runs_total = metrics.counter(
+    "runner_runs_total", "Finished runs by outcome: success, nonzero, timeout, error, syntax_error"
+)
+output_truncated_total = metrics.counter("runner_output_truncated_total", "Runs whose stdout or stderr was cut")
+queue_wait_seconds = metrics.histogram("runner_queue_wait_seconds", "Time spent waiting for a free slot")
+setup_seconds = metrics.histogram("runner_setup_seconds", "Time to prepare the workspace before the program starts")
+execution_seconds = metrics.histogram("runner_execution_seconds", "Wall time of the program itself")
+cleanup_seconds = metrics.histogram(
+    "runner_cleanup_seconds", "Time to kill leftovers and hand the workspace back",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+)
+workspace_reset_seconds = metrics.histogram(
+    "runner_workspace_reset_seconds", "Time to wipe and recreate a workspace in the background"
+)
+
+coalesced_total = metrics.counter(
+    "runner_coalesced_total", "Requests answered by another identical request's run"
+)
+
+slot_pool = SlotPool(SLOTS, max_per_user=MAX_RUNS_PER_USER, course_weights=COURSE_WEIGHTS)
+coalescer = Coalescer(retention=COALESCE_RETENTION)
+rate_limiter = RateLimiter(USER_RATE, USER_BURST)
+workspace_pool = WorkspacePool(
+    WORKSPACE_DIR,
+    [f"student{index}" for index in range(1, SLOTS + 1)],
+    per_user=WORKSPACES_PER_SLOT,
+    datasets_dir=DATASETS_DIR,
+    on_reset=workspace_reset_seconds.observe
+)
+metrics.gauge("runner_in_flight", "Programs running right now", function=lambda: slot_pool.busy)
+metrics.gauge("runner_queued", "Programs waiting for a free slot", function=lambda: slot_pool.waiting)
+# Отдельный пул потоков под запуски: одновременно исполняется не больше SLOTS программ
+executor = ThreadPoolExecutor(max_workers=SLOTS, thread_name_prefix="runner")
+THREAD_ENV = {
+    name: THREADS_PER_RUN
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+}
+# hash seed и пулы потоков дети наследуют от зиготы, задать их можно только при её старте
+zygote = Zygote(env={**THREAD_ENV, **({"PYTHONHASHSEED": "0"} if DETERMINISTIC else {})})
+
+if CACHE:
+    result_cache = ResultCache(
+        CACHE_DIR,
+        memory_items=CACHE_MEMORY_ITEMS,
+        ttl=CACHE_TTL,
+        disk_size=CACHE_DISK_SIZE
+    )
+    fingerprint = interpreter_fingerprint(MODE)
+    datasets_version = DatasetsVersion(DATASETS_DIR)
+else:
+    result_cache = None
+
+
+def _build_datastore():
+    try:
+        from sandbox import datastore
+        rebuilt = datastore.build(DATASETS_DIR, DATASTORE_DIR)
+    except Exception as err:
+        # без хранилища студенты по-прежнему могут читать CSV напрямую
+        print(f"datastore: не удалось собрать хранилище: {err!r}", file=sys.stderr)
+        return
+    if rebuilt:
+        print(f"datastore: пересобраны {', '.join(rebuilt)}", file=sys.stderr)
+
+
+def _setup_slots():
+    for slot in slot_pool.slots:
+        slot.setup()
+        # от прошлого запуска сервера могли остаться процессы и файлы в /tmp
+        slot.cleanup()
+    if slot_pool.slots[0].cgroup is None:
+        print(f"cgroup v2 недоступна в {CGROUP_ROOT}, процессы будут убиваться через /proc", file=sys.stderr)
+
+
+async def startup():
+    await asyncio.to_thread(_setup_slots)
+    await asyncio.to_thread(workspace_pool.start)
+    if DATASTORE:
+        await asyncio.to_thread(_build_datastore)
+    if MODE == 'zygote':
+        await asyncio.to_thread(zygote.start)
+
+
+async def shutdown():
+    if MODE == 'zygote':
+        await asyncio.to_thread(zygote.stop)
+    await asyncio.to_thread(workspace_pool.stop)
+    for slot in slot_pool.slots:
+        if slot.cgroup is not None:
+            slot.cgroup.remove()
+
+
+def sandbox_env(workdir: str, limits: Limits):
+    """
+    Окружение программы студента (и интерпретатора сессии, см. sessions.py)
+    """
+    env = {
+        # своих домашних директорий у пользователей слотов нет
+        "HOME": workdir,
+        "TMPDIR": os.path.join(workdir, TMP_DIRECTORY),
+        "MPLBACKEND": "Agg",
+        "MPLCONFIGDIR": workdir,
+        "PYTHONPATH": SANDBOX_DIR,
+        "PYRUNNER_DATASTORE": DATASTORE_DIR,
+        **THREAD_ENV
+    }
+    if limits.plots is not None:
+        env["PYRUNNER_ARTIFACTS"] = os.path.join(workdir, artifacts.DIRECTORY)
+        env["PYRUNNER_PLOT_FORMAT"] = limits.plots
+    if limits.profile:
+        env["PYRUNNER_PROFILE"] = os.path.join(workdir, PROFILE_FILE)
+    if DETERMINISTIC:
+        env["PYTHONHASHSEED"] = "0"
+        env["PYRUNNER_DETERMINISTIC"] = "1"
+    return env
+
+
+def _wait4(proc: subprocess.Popen, deadline=None):
+    """
+    Ожидание завершения через os.wait4: в отличие от Popen.wait
+    она возвращает потребление ресурсов всего дерева процессов.
+    Возвращает False, если процесс не завершился к deadline
+    """
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG if deadline is not None else 0)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            proc.usage = usage_from_rusage(rusage)
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+
+
+def prepare_child(rlimits, cgroup, uid, gid):
+    """
+    Выполняется в дочернем процессе между fork и exec: под root задаёт
+    ограничения и cgroup, затем сбрасывает привилегии до пользователя слота (или сессии).
+    Без промежуточного su интерпретатор сам получает SIGTERM по таймауту
+    """
+    apply_rlimits(rlimits)
+    if cgroup is not None:
+        cgroup.add()
+    os.setgroups([])
+    os.setgid(gid)
+    os.setuid(uid)
+
+
+def _run_subprocess(slot: Slot, workdir: str, limits: Limits, on_output=None):
+    code_file = os.path.join(workdir, "main.py")
+    execution = Execution()
+    execution.started = time.monotonic()
+    deadline = execution.started + limits.timeout
+    # Вывод ограничивает PipeReader: остаток он вычитывает и отбрасывает,
+    # так что программа не получает SIGPIPE
+    with subprocess.Popen(
+        [PYTHON, code_file],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=workdir,
+        env=sandbox_env(workdir, limits),
+        start_new_session=True,
+        preexec_fn=partial(prepare_child, slot.rlimits(limits), slot.cgroup, slot.uid, slot.gid)
+    ) as proc:
+        slot.process = proc
+        reader = PipeReader(
+            proc.stdout.fileno(),
+            proc.stderr.fileno(),
+            limits=(limits.max_stdout_size, limits.max_stderr_size),
+            on_output=on_output
+        )
+        try:
+            if not (reader.read(deadline) and _wait4(proc, deadline)):
+                execution.timed_out = True
+                # сначала SIGTERM: sitecustomize превращает его в SystemExit,
+                # и программа успевает сбросить буферы вывода
+                slot.kill(signal.SIGTERM)
+                grace = time.monotonic() + KILL_GRACE
+                if not (reader.read(grace) and _wait4(proc, grace)):
+                    # убиваем всё дерево процессов
+                    slot.kill()
+                    _wait4(proc)
+        finally:
+            reader.close()
+            slot.process = None
+    execution.wall_time = time.monotonic() - execution.started
+    execution.stdout, execution.stderr = bytes(reader.stdout), bytes(reader.stderr)
+    execution.output_sizes = reader.sizes
+    execution.returncode = proc.returncode
+    execution.usage = proc.usage
+    return execution
+
+
+def _run_zygote(slot: Slot, workdir: str, limits: Limits, on_output=None):
+    execution = Execution()
+    execution.started = time.monotonic()
+    proc = zygote.spawn(
+        user=slot.user,
+        cwd=workdir,
+        path=os.path.join(workdir, "main.py"),
+        env=sandbox_env(workdir, limits),
+        rlimits=slot.rlimits(limits),
+        cgroup=slot.cgroup.path if slot.cgroup is not None else None
+    )
+    slot.process = proc
+    try:
+        execution.stdout, execution.stderr = proc.communicate(
+            timeout=limits.timeout,
+            limits=(limits.max_stdout_size, limits.max_stderr_size),
+            on_output=on_output,
+            grace=KILL_GRACE
+        )
+    except subprocess.TimeoutExpired as exc:
+        execution.timed_out = True
+        execution.stdout, execution.stderr = exc.output, exc.stderr
+    finally:
+        slot.process = None
+    execution.wall_time = time.monotonic() - execution.started
+    execution.output_sizes = proc.output_sizes
+    execution.returncode = proc.returncode
+    execution.usage = proc.usage
+    return execution
+
+
+def _read_profile(workdir: str, uid: int):
+    # файл пишет программа студента, поэтому он проверяется как любой её вывод
+    data = artifacts.read(workdir, PROFILE_FILE, uid, MAX_PROFILE_SIZE)
+    if data is None:
+        return None
+    try:
+        return Profile.model_validate_json(data)
+    except ValidationError:
+        return None
+
+
+LIMIT_MESSAGES = {
+    "timeout": "Execution timed out",
+    "cpu_time": "CPU time limit exceeded",
+}
+
+
+def _execute(slot: Slot, code: str, limits: Limits, on_output=None):
+    started = time.monotonic()
+    # чистая директория, уже принадлежащая пользователю слота, со ссылкой на датасеты
+    workspace = workspace_pool.acquire(slot.user)
+    try:
+        # сохраняем код в main.py
+        with open(os.path.join(workspace.path, "main.py"), "w") as f:
+            f.write(code)
+        if limits.plots is not None:
+            artifacts.prepare(workspace.path, slot.uid, slot.gid)
+
+        events = slot.events()
+        if MODE == 'zygote':
+            execution = _run_zygote(slot, workspace.path, limits, on_output)
+        else:
+            execution = _run_subprocess(slot, workspace.path, limits, on_output)
+        execution.events = {name: count - events[name] for name, count in slot.events().items()}
+
+        if limits.plots is not None:
+            execution.artifacts, execution.artifacts_truncated = artifacts.collect(
+                workspace.path, slot.uid, limits.max_artifacts_size
+            )
+        if limits.profile:
+            execution.profile = _read_profile(workspace.path, slot.uid)
+    except BaseException:
+        runs_total.inc(outcome="error")
+        raise
+    finally:
+        finished = time.monotonic()
+        # убиваем всё, что осталось от запуска; другие слоты не затрагиваются
+        slot.cleanup()
+        # очистка директории идёт в фоне
+        workspace_pool.release(workspace)
+
+    setup_seconds.observe(execution.started - started)
+    execution_seconds.observe(execution.wall_time)
+    cleanup_seconds.observe(time.monotonic() - finished)
+    if execution.timed_out:
+        runs_total.inc(outcome="timeout")
+    else:
+        runs_total.inc(outcome="success" if execution.returncode == 0 else "nonzero")
+    if execution.stdout_truncated or execution.stderr_truncated:
+        output_truncated_total.inc()
+    return build_response(execution, limits)
+
+
+def build_response(execution: Execution, limits: Limits):
+    usage = dict(
+        stdout_truncated=execution.stdout_truncated,
+        stderr_truncated=execution.stderr_truncated,
+        stdout_bytes=execution.output_sizes["stdout"],
+        stderr_bytes=execution.output_sizes["stderr"],
+        **execution.usage,
+        wall_time=round(execution.wall_time, 4),
+        limit_exceeded=execution.limit_exceeded(limits),
+        artifacts=execution.artifacts,
+        artifacts_truncated=execution.artifacts_truncated,
+        profile=execution.profile
+    )
+    stdout = execution.stdout.decode("utf-8", errors="ignore")
+    stderr = execution.stderr.decode("utf-8", errors="ignore")
+    # вывод до срабатывания лимита возвращается вместе с причиной
+    message = LIMIT_MESSAGES.get(usage["limit_exceeded"])
+    if message is not None:
+        stderr += ("\n" if stderr and not stderr.endswith("\n") else "") + message
+    if execution.timed_out:
+        return RunPythonResponse(
+            stdout=stdout,
+            stderr=stderr,
+            return_code=None,
+            timeout=True,
+            **usage
+            )
+
+    return RunPythonResponse(
+        stdout=stdout,
+        stderr=stderr,
+        return_code=execution.returncode,
+        timeout=False,
+        **usage
+        )
+
+
+def _check_syntax(code):
+    """
+    Компиляция кода в процессе runner. Если код не компилируется, возвращает
+    результат запуска с ошибкой — так программа не занимает слот.
+    Код, на котором переполняется стек парсера или компилятора, уходит в песочницу:
+    там он упадёт с той же ошибкой, но уже в рамках лимитов запуска
+    """
+    try:
+        compile(code, "main.py", "exec", dont_inherit=True)
+        return None
+    except (MemoryError, RecursionError):
+        return None
+    except SyntaxError as err:
+        error = err
+        info = SyntaxErrorInfo(
+            line=err.lineno,
+            offset=err.offset,
+            end_line=err.end_lineno,
+            end_offset=err.end_offset,
+            message=err.msg,
+            text=err.text.rstrip("\n") if err.text is not None else None
+        )
+    except ValueError as err:
+        # до Python 3.12 нулевые байты в исходнике дают ValueError
+        error = err
+        info = SyntaxErrorInfo(message=str(err))
+    return RunPythonResponse(
+        stdout="",
+        stderr="".join(traceback.format_exception_only(error)),
+        return_code=1,
+        timeout=False,
+        syntax_error=info
+    )
+
+
+async def check_syntax(code):
+    """
+    Проверка синтаксиса перед запуском (см. _check_syntax), если она включена
+    и код не слишком большой. None — код можно запускать
+    """
+    if not SYNTAX_CHECK or len(code) > SYNTAX_CHECK_MAX_SIZE:
+        return None
+    return await asyncio.to_thread(_check_syntax, code)
+
+
+async def run_code(code, on_output=None, limits=None, use_cache=True, on_start=None,
+                   on_queued=None, user_id=None, course_id=None):
+    """
+    Запуск кода студента в свободном слоте.
+    on_output(name, chunk) вызывается из рабочего потока для каждого куска вывода,
+    on_queued(ticket) — если запрос встал в очередь (см. SlotPool.queue_info),
+    on_start() — когда программа получила слот и начала исполняться.
+    user_id и course_id определяют место в справедливой очереди.
+    Код с синтаксической ошибкой не запускается (см. check_syntax).
+    При включённом кэше одинаковый код с теми же ограничениями не перезапускается
+    """
+    limits = limits or Limits()
+    submissions_total.inc()
+    result = await check_syntax(code)
+    if result is not None:
+        runs_total.inc(outcome="syntax_error")
+        return result
+    if result_cache is None:
+        return await _run_in_slot(code, on_output, limits, on_start, on_queued, user_id, course_id)
+
+    key = None
+    # профиль из кэша ничего не скажет о текущей нагрузке
+    if use_cache and not limits.profile:
+        key = ResultCache.make_key(
+            fingerprint,
+            await asyncio.to_thread(datasets_version.get),
+            sorted(vars(limits).items()),
+            code
+        )
+        cached = await asyncio.to_thread(result_cache.get, key)
+        if cached is not None:
+            return RunPythonResponse(**cached, cached=True)
+
+    result = await _run_in_slot(code, on_output, limits, on_start, on_queued, user_id, course_id)
+    result.cached = False
+    # таймаут зависит от нагрузки на сервер, его не кэшируем
+    if key is not None and not result.timeout:
+        await asyncio.to_thread(result_cache.put, key, result.model_dump(exclude={"cached"}))
+    return result
+
+
+async def run_code_once(code, limits=None, use_cache=True, user_id=None, course_id=None, idempotency_key=None):
+    """
+    run_code для /run: одновременные одинаковые запросы исполняются один раз
+    (см. coalesce.py). Одинаковыми считаются запросы пользователя с одним ключом
+    идемпотентности, а в детерминированном режиме — и любые запросы с тем же
+    кодом и ограничениями, если они не отказались от кэша.
+    С тем же ключом, но другим кодом бросает IdempotencyConflict
+    """
+    limits = limits or Limits()
+    fingerprint = ResultCache.make_key(sorted(vars(limits).items()), code)
+    if idempotency_key is not None:
+        key = ("key", user_id, idempotency_key)
+    elif DETERMINISTIC and use_cache and not limits.profile:
+        key = ("code", fingerprint)
+    else:
+        return await run_code(code, limits=limits, use_cache=use_cache, user_id=user_id, course_id=course_id)
+
+    result, shared = await coalescer.run(
+        key,
+        fingerprint,
+        lambda: run_code(code, limits=limits, use_cache=use_cache, user_id=user_id, course_id=course_id)
+    )
+    if not shared:
+        return result
+    submissions_total.inc()
+    coalesced_total.inc()
+    return result.model_copy(update={"coalesced": True})
+
+
+async def _run_in_slot(code, on_output, limits, on_start=None, on_queued=None, user_id=None, course_id=None):
+    async with slot_pool.acquire(user_id, course_id, on_queued) as slot:
+        if on_start is not None:
+            on_start()
+        # блокирующий запуск уходит в поток, event loop при этом свободен
+        future = asyncio.get_running_loop().run_in_executor(executor, _execute, slot, code, limits, on_output)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # запрос отменён — останавливаем программу и освобождаем слот
+            # только после того, как поток закончит уборку
+            slot.kill()
+            with suppress(Exception):
+                await future
+            raise
+
+
+async def stream_code(code, limits=None, use_cache=True, user_id=None, course_id=None):
+    """
+    Запуск кода с потоковой выдачей вывода.
+    Отдаёт пару ("queued", {"position", "estimated_wait"}), если свободного слота нет,
+    пары ("stdout" | "stderr", текст) по мере появления вывода
+    и последней парой ("result", RunPythonResponse)
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def on_output(name, chunk):
+        loop.call_soon_threadsafe(queue.put_nowait, (name, chunk))
+
+    def on_queued(ticket):
+        position, estimated_wait = slot_pool.queue_info(ticket)
+        queue.put_nowait(("queued", {"position": position, "estimated_wait": estimated_wait}))
+
+    task = asyncio.create_task(run_code(
+        code, on_output=on_output, limits=limits, use_cache=use_cache,
+        on_queued=on_queued, user_id=user_id, course_id=course_id
+    ))
+    # вывод из потока попадает в очередь раньше, чем завершится задача
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    # кусок вывода может оборвать многобайтовый символ посередине
+    decoders = {
+        "stdout": codecs.getincrementaldecoder("utf-8")(errors="ignore"),
+        "stderr": codecs.getincrementaldecoder("utf-8")(errors="ignore"),
+    }
+    streamed = {"stdout": [], "stderr": []}
+    try:
+        while (item := await queue.get()) is not None:
+            name, chunk = item
+            if name == "queued":
+                yield name, chunk
+                continue
+            text = decoders[name].decode(chunk)
+            if text:
+                streamed[name].append(text)
+                yield name, text
+
+        result = task.result()
+        # вывод, которого не было в потоке: результат, который не исполнялся
+        # (из кэша, синтаксическая ошибка), и сообщение о сработавшем лимите
+        for name in ("stdout", "stderr"):
+            full, sent = getattr(result, name), "".join(streamed[name])
+            if full.startswith(sent):
+                rest = full[len(sent):]
+            elif name == "stderr" and result.limit_exceeded in LIMIT_MESSAGES:
+                rest = "\n" + LIMIT_MESSAGES[result.limit_exceeded]
+            else:
+                rest = ""
+            if rest:
+                yield name, rest
+        yield "result", result
+    finally:
+        # клиент ушёл раньше времени — программу останавливаем
+        if not task.done():
+            task.cancel()
+
+
+async def run_batch(requests):
+    """
+    Запуск набора программ на всех слотах сразу.
+    Отдаёт пары (индекс, RunPythonResponse) в порядке завершения
+    """
+    async def run_item(index, req):
+        return index, await run_code(
+            req.code,
+            limits=Limits.from_request(req),
+            use_cache=req.cache is not False,
+            user_id=req.user_id,
+            course_id=req.course_id
+        )
+
+    tasks = [asyncio.create_task(run_item(index, req)) for index, req in enumerate(requests)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # клиент ушёл — недоделанные запуски отменяем
+        for task in tasks:
+            task.cancel()
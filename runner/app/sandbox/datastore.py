@@ -0,0 +1,161 @@
+"""
+Общее хранилище датасетов, разобранных заранее.
+
+При старте сервера каждый CSV из каталога datasets переводится в набор
+.npy файлов — по файлу на колонку (build). Программы студентов открывают
+их через mmap только на чтение, поэтому разбор CSV не повторяется,
+а страницы в page cache общие для всех запусков:
+
+    from datastore import load
+    df = load("first")            # то же, что pd.read_csv("datasets/first.csv")
+
+    from datastore import arrays
+    columns = arrays("first")     # {"id": ndarray, ...} без pandas
+
+Строковые колонки хранятся как коды категорий, поэтому load возвращает их
+с типом category. Массивы открыты только на чтение: чтобы менять
+DataFrame на месте, сначала сделайте df.copy() или вызовите load(name, copy=True)
+"""
+import json
+import os
+import shutil
+
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+
+def _store_dir():
+    return os.environ.get("PYRUNNER_DATASTORE", "datastore")
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# Сборка хранилища (сервер)
+# ---------------------------------------------------------------------------
+
+def _write_dataset(frame, target, source):
+    import numpy as np
+    import pandas as pd
+
+    tmp_path = f"{target}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for index, (name, column) in enumerate(frame.items()):
+        file = f"{index}.npy"
+        if column.dtype == object or isinstance(column.dtype, pd.StringDtype):
+            values = column.where(column.isna(), column.astype(str))
+            categorical = pd.Categorical(values)
+            np.save(os.path.join(tmp_path, file), categorical.codes)
+            columns.append({
+                "name": str(name),
+                "file": file,
+                "categories": [str(value) for value in categorical.categories],
+            })
+        else:
+            np.save(os.path.join(tmp_path, file), column.to_numpy())
+            columns.append({"name": str(name), "file": file})
+
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"source": source, "rows": len(frame), "columns": columns}, f, ensure_ascii=False)
+
+    # Подмена каталога целиком: открытые mmap старой версии продолжают работать
+    old_path = f"{target}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(target):
+        os.rename(target, old_path)
+    os.rename(tmp_path, target)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def build(datasets_dir, store_dir=None):
+    """
+    Переводит все CSV из datasets_dir в хранилище. Неизменившиеся файлы
+    (по размеру и времени изменения) не разбираются повторно.
+    Возвращает имена датасетов, которые были пересобраны
+    """
+    import pandas as pd
+
+    store_dir = store_dir or _store_dir()
+    rebuilt = []
+    for root, dirs, files in os.walk(datasets_dir, followlinks=True):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith(".csv"):
+                continue
+            path = os.path.join(root, file)
+            name = os.path.relpath(path, datasets_dir)[:-len(".csv")].replace(os.sep, "/")
+            target = os.path.join(store_dir, name)
+
+            stat = os.stat(path)
+            source = {"version": FORMAT_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if _read_meta(target).get("source") == source:
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write_dataset(pd.read_csv(path), target, source)
+            rebuilt.append(name)
+    return rebuilt
+
+
+# ---------------------------------------------------------------------------
+# Чтение (программы студентов)
+# ---------------------------------------------------------------------------
+
+def _open(name):
+    path = os.path.join(_store_dir(), name)
+    meta = _read_meta(path)
+    if not meta:
+        raise FileNotFoundError(f"Датасет {name!r} не найден в хранилище")
+    return path, meta
+
+
+def arrays(name):
+    """
+    Колонки датасета как NumPy массивы, отображённые в память только на чтение.
+    Для строковых колонок возвращаются коды категорий, сами категории — в categories(name)
+    """
+    import numpy as np
+
+    path, meta = _open(name)
+    return {
+        column["name"]: np.load(os.path.join(path, column["file"]), mmap_mode="r")
+        for column in meta["columns"]
+    }
+
+
+def categories(name):
+    """
+    Категории строковых колонок: {колонка: [значения]}
+    """
+    _, meta = _open(name)
+    return {column["name"]: column["categories"] for column in meta["columns"] if "categories" in column}
+
+
+def load(name, copy=False):
+    """
+    DataFrame поверх общего хранилища. По умолчанию без копирования данных,
+    при copy=True — обычный изменяемый DataFrame
+    """
+    import numpy as np
+    import pandas as pd
+
+    path, meta = _open(name)
+    data = {}
+    for column in meta["columns"]:
+        values = np.load(os.path.join(path, column["file"]), mmap_mode="r")
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, categories=column["categories"])
+        data[column["name"]] = values
+    # copy=False не даёт pandas склеить колонки одного типа в новый блок
+    frame = pd.DataFrame(data, copy=False)
+    return frame.copy() if copy else frame
@@ -0,0 +1,73 @@
+"""
+Интерпретатор сессии (см. sessions.py): исполняет ячейки одну за другой
+в общем пространстве имён, как ядро Jupyter.
+
+Ячейки приходят через stdin строками JSON {"code": ..., "token": ...}; программе
+студента вместо stdin достаётся /dev/null. После каждой ячейки в канал управления
+(дескриптор PYRUNNER_CONTROL_FD) пишется строка {"token": ..., "returncode": ...} —
+к этому моменту весь вывод ячейки уже сброшен в stdout/stderr. Токен новый
+для каждой ячейки, так что строки, записанные в канал не ядром, runner не примет.
+SIGINT прерывает текущую ячейку (KeyboardInterrupt), сессия при этом живёт дальше
+"""
+import builtins
+import json
+import linecache
+import os
+import signal
+import sys
+import traceback
+import types
+
+
+def _run_cell(code, number, namespace):
+    filename = f"<cell {number}>"
+    # чтобы в traceback были строки кода ячейки
+    linecache.cache[filename] = (len(code), None, code.splitlines(keepends=True), filename)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        exec(compile(code, filename, "exec"), namespace)
+        return 0
+    except SystemExit as exc:
+        # exit() завершает ячейку, но не сессию
+        if exc.code is None or isinstance(exc.code, int):
+            return exc.code or 0
+        print(exc.code, file=sys.stderr)
+        return 1
+    except BaseException as exc:
+        # Первый кадр — этот модуль, студенту он не нужен
+        tb = exc.__traceback__.tb_next if exc.__traceback__ else None
+        traceback.print_exception(type(exc), exc, tb)
+        return 1
+    finally:
+        # SIGINT, опоздавший к концу ячейки, не должен убить сессию
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def main():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    commands = os.fdopen(os.dup(0), "rb")
+    control = os.fdopen(int(os.environ.pop("PYRUNNER_CONTROL_FD")), "wb", buffering=0)
+    # процессы, запущенные ячейками, канал управления не наследуют
+    os.set_inheritable(control.fileno(), False)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    module = types.ModuleType("__main__")
+    module.__builtins__ = builtins
+    sys.modules["__main__"] = module
+
+    for number, line in enumerate(commands, 1):
+        command = json.loads(line)
+        token = command.pop("token", None)
+        returncode = _run_cell(command.pop("code"), number, module.__dict__)
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+        control.write(json.dumps({"token": token, "returncode": returncode}).encode() + b"\n")
+
+
+if __name__ == "__main__":
+    main()
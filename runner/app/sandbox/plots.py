@@ -0,0 +1,53 @@
+"""
+Сохранение графиков программы студента в артефакты (включается sitecustomize,
+если задан PYRUNNER_ARTIFACTS).
+
+matplotlib работает с бэкендом Agg: plt.show() и выход из программы сохраняют
+открытые фигуры в PNG или SVG (PYRUNNER_PLOT_FORMAT) без даты и версии в
+метаданных, чтобы одинаковые графики давали одинаковые файлы. У plotly нет
+встроенного растеризатора, поэтому fig.show() сохраняет JSON-спецификацию
+фигуры — Jupyter рисует её сам. Файлы после запуска забирает runner (artifacts.py)
+"""
+import atexit
+import itertools
+import os
+
+
+_counter = itertools.count(1)
+
+
+def _path(directory, extension):
+    # порядок файлов совпадает с порядком показа графиков
+    return os.path.join(directory, f"{next(_counter):03d}.{extension}")
+
+
+def _save_figures(pyplot, directory, fmt):
+    for number in pyplot.get_fignums():
+        figure = pyplot.figure(number)
+        if fmt == "svg":
+            figure.savefig(_path(directory, "svg"), format="svg", metadata={"Date": None, "Creator": None})
+        else:
+            figure.savefig(
+                _path(directory, "png"), format="png", metadata={"Software": None}, pil_kwargs={"optimize": True}
+            )
+    pyplot.close("all")
+
+
+def patch_pyplot(pyplot, directory, fmt):
+    pyplot.rcParams["svg.hashsalt"] = "pyrunner"
+
+    def show(*args, **kwargs):
+        _save_figures(pyplot, directory, fmt)
+
+    pyplot.show = show
+    # фигуры, которые так и не показали через plt.show()
+    atexit.register(_save_figures, pyplot, directory, fmt)
+
+
+def patch_plotly(plotly_io, directory):
+    # fig.show() вызывает plotly.io.show
+    def show(fig, *args, **kwargs):
+        with open(_path(directory, "plotly.json"), "w", encoding="utf-8") as f:
+            f.write(plotly_io.to_json(fig))
+
+    plotly_io.show = show
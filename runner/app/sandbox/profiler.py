@@ -0,0 +1,125 @@
+"""
+Профиль программы студента (включается sitecustomize, если задан PYRUNNER_PROFILE).
+
+Импорты замеряются так же, как это делает python -X importtime: оборачивается
+importlib._bootstrap._find_and_load, которую интерпретатор вызывает для каждого
+ещё не загруженного модуля. Для модуля считается время с вложенными импортами
+и без них. Под зиготой модули из RUNNER__PRELOAD уже загружены и в профиль
+не попадают — их импорт ничего не стоит.
+
+Функции сэмплируются по SIGPROF (таймер процессорного времени): каждый сэмпл
+приписывает процессорное время с прошлого сэмпла функции, которая исполнялась
+в главном потоке. Долгий вызов C-кода (например, чтение CSV в pandas) достаётся
+вызвавшей его функции на Python.
+
+При выходе результат пишется в JSON-файл, который забирает runner
+"""
+import _thread
+import atexit
+import json
+import os
+import signal
+import time
+
+import importlib._bootstrap as _bootstrap
+
+
+INTERVAL = 0.005
+TOP = 20
+
+_imports = {}
+_stacks = {}
+_functions = {}
+_stdlib = os.path.dirname(os.__file__)
+_last_cpu = 0.0
+_samples = 0
+_original = None
+
+
+def _find_and_load(original):
+    def find_and_load(name, import_):
+        # вложенные импорты считаются отдельно в каждом потоке
+        stack = _stacks.setdefault(_thread.get_ident(), [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, import_)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            _imports[name] = (elapsed, elapsed - children)
+            if stack:
+                stack[-1] += elapsed
+
+    return find_and_load
+
+
+def _short(filename):
+    """
+    Путь без префиксов site-packages и стандартной библиотеки
+    """
+    _, marker, rest = filename.rpartition("site-packages" + os.sep)
+    if marker:
+        return rest
+    if filename.startswith(_stdlib + os.sep):
+        return os.path.relpath(filename, _stdlib)
+    if os.path.isabs(filename) and filename.startswith(os.getcwd() + os.sep):
+        return os.path.relpath(filename)
+    return filename
+
+
+def _sample(signum, frame):
+    global _last_cpu, _samples
+    now = time.process_time()
+    elapsed, _last_cpu = now - _last_cpu, now
+    if frame is None:
+        return
+    code = frame.f_code
+    key = (code.co_filename, getattr(code, "co_qualname", code.co_name), code.co_firstlineno)
+    total, samples = _functions.get(key, (0.0, 0))
+    _functions[key] = (total + elapsed, samples + 1)
+    _samples += 1
+
+
+def _report():
+    imports = sorted(_imports.items(), key=lambda item: item[1][0], reverse=True)[:TOP]
+    functions = sorted(_functions.items(), key=lambda item: item[1][0], reverse=True)[:TOP]
+    return {
+        # собственные времена модулей в сумме дают всё время, ушедшее на импорты
+        "import_time": round(sum(own for _, own in _imports.values()), 6),
+        "imports": [
+            {"module": name, "cumulative_time": round(cumulative, 6), "self_time": round(own, 6)}
+            for name, (cumulative, own) in imports
+        ],
+        "functions": [
+            {
+                "function": function,
+                "file": _short(filename),
+                "line": line,
+                "self_time": round(total, 6),
+                "samples": samples,
+            }
+            for (filename, function, line), (total, samples) in functions
+        ],
+        "sample_interval": INTERVAL,
+        "samples": _samples,
+    }
+
+
+def _write(path):
+    signal.setitimer(signal.ITIMER_PROF, 0)
+    signal.signal(signal.SIGPROF, signal.SIG_IGN)
+    _bootstrap._find_and_load = _original
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_report(), f)
+
+
+def install(path):
+    global _original, _last_cpu
+    _original = _bootstrap._find_and_load
+    _bootstrap._find_and_load = _find_and_load(_original)
+    _last_cpu = time.process_time()
+    signal.signal(signal.SIGPROF, _sample)
+    signal.setitimer(signal.ITIMER_PROF, INTERVAL, INTERVAL)
+    # регистрируется раньше остальных обработчиков выхода и выполняется последним
+    atexit.register(_write, path)
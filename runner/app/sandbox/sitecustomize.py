@@ -0,0 +1,90 @@
+"""
+Подключается к программам студентов через PYTHONPATH (режим subprocess).
+
+SIGTERM (таймаут) и SIGXCPU (лимит процессорного времени) превращаются
+в SystemExit: по умолчанию они убивают процесс сразу, и вывод, оставшийся
+в буфере sys.stdout, теряется.
+
+Если задан PYRUNNER_PROFILE, при выходе в этот файл пишется профиль
+импортов и функций (см. profiler.py).
+
+Если задан PYRUNNER_ARTIFACTS, графики matplotlib и plotly сохраняются
+в эту директорию (см. plots.py).
+
+В детерминированном режиме (PYRUNNER_DETERMINISTIC=1) фиксирует seed
+у random и у numpy.random, чтобы одинаковый код давал одинаковый вывод
+и его результат можно было брать из кэша
+"""
+import os
+import signal
+import sys
+
+
+SEED = 0
+
+
+class _PatchOnImport:
+    """
+    Вызывает patch(module) сразу после импорта модуля name, не импортируя его заранее
+    """
+
+    def __init__(self, name, patch):
+        self.name = name
+        self.patch = patch
+
+    def find_spec(self, name, path=None, target=None):
+        if name != self.name:
+            return None
+        sys.meta_path.remove(self)
+
+        import importlib.util
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.loader is None:
+            return spec
+
+        exec_module = spec.loader.exec_module
+
+        def exec_and_patch(module):
+            exec_module(module)
+            self.patch(module)
+
+        spec.loader.exec_module = exec_and_patch
+        return spec
+
+
+def _on_import(name, patch):
+    # под зиготой модуль может быть импортирован заранее
+    if name in sys.modules:
+        patch(sys.modules[name])
+    else:
+        sys.meta_path.insert(0, _PatchOnImport(name, patch))
+
+
+def _exit_on_signal(signum, frame):
+    # повторный сигнал не должен прервать выход
+    signal.signal(signum, signal.SIG_IGN)
+    raise SystemExit(128 + signum)
+
+
+for _signum in (signal.SIGTERM, signal.SIGXCPU):
+    signal.signal(_signum, _exit_on_signal)
+
+
+if os.environ.get("PYRUNNER_PROFILE"):
+    # до остальных: обработчик выхода профиля должен выполниться последним
+    import profiler
+    profiler.install(os.environ["PYRUNNER_PROFILE"])
+
+
+if os.environ.get("PYRUNNER_DETERMINISTIC") == "1":
+    import random
+    random.seed(SEED)
+    _on_import("numpy.random", lambda module: module.seed(SEED))
+
+
+if os.environ.get("PYRUNNER_ARTIFACTS"):
+    import plots
+    _artifacts = os.environ["PYRUNNER_ARTIFACTS"]
+    _plot_format = os.environ.get("PYRUNNER_PLOT_FORMAT", "png")
+    _on_import("matplotlib.pyplot", lambda pyplot: plots.patch_pyplot(pyplot, _artifacts, _plot_format))
+    _on_import("plotly.io", lambda plotly_io: plots.patch_plotly(plotly_io, _artifacts))
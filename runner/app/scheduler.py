@@ -0,0 +1,241 @@
+"""
+Честное распределение слотов между пользователями и курсами.
+
+FairQueue — двухуровневая взвешенная справедливая очередь (start-time fair
+queuing): сначала выбирается курс с наименьшим виртуальным временем
+(курс с весом 2 получает вдвое больше запусков, чем курс с весом 1),
+затем внутри курса — пользователь с наименьшим виртуальным временем.
+Внутри одного пользователя порядок FIFO. Пользователь, у которого уже
+исполняется max_per_user программ, пропускает свою очередь.
+
+RateLimiter — token bucket на пользователя, проверяется при приёме запроса.
+
+Запросы без user_id/course_id попадают в общий поток и лимитам не подчиняются
+"""
+from collections import deque
+import asyncio
+import time
+
+
+def parse_weights(value):
+    """
+    "course_a=2,course_b=0.5" -> {"course_a": 2.0, "course_b": 0.5}
+    """
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    rate запусков в секунду на пользователя с запасом burst; rate=0 — без ограничения
+    """
+
+    def __init__(self, rate=0.0, burst=10.0, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (токены, время обновления)
+
+    def check(self, key, cost=1):
+        """
+        Списывает cost токенов или бросает RateLimited. Пакет больше burst
+        списывает весь запас, чтобы его можно было отправить хоть когда-нибудь
+        """
+        if not self.rate or key is None:
+            return
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < cost:
+            raise RateLimited((cost - tokens) / self.rate)
+        self._buckets[key] = (tokens - cost, now)
+
+        if len(self._buckets) > self.max_keys:
+            # полные корзины ничем не отличаются от отсутствующих
+            self._buckets = {
+                key: (tokens, updated_at) for key, (tokens, updated_at) in self._buckets.items()
+                if tokens + (now - updated_at) * self.rate < self.burst
+            }
+
+
+class Ticket:
+    """
+    Место в очереди за слотом
+    """
+
+    def __init__(self, user_id, course_id):
+        self.user_id = user_id
+        self.course_id = course_id
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def ready(self):
+        return self.future.done()
+
+
+class FairQueue:
+
+    def __init__(self, items, max_per_user=0, course_weights=None):
+        self._free = deque(items)
+        self.size = len(self._free)
+        self.max_per_user = max_per_user
+        self.course_weights = course_weights or {}
+        self._waiting = {}  # course_id -> {user_id -> deque[Ticket]}
+        self._running = {}  # user_id -> число исполняющихся программ
+        # виртуальное время курсов и пользователей внутри курсов, и «часы» —
+        # время последнего выбранного, с которого начинает вновь активный поток
+        self._course_time = {}
+        self._course_clock = 0.0
+        self._user_time = {}  # (course_id, user_id) -> время
+        self._user_clock = {}  # course_id -> время
+        # среднее время занятости слота, для оценки ожидания
+        self._service_time = None
+
+    @property
+    def busy(self):
+        return self.size - len(self._free)
+
+    @property
+    def waiting(self):
+        return sum(len(queue) for users in self._waiting.values() for queue in users.values())
+
+    def _weight(self, course_id):
+        return self.course_weights.get(course_id, 1.0)
+
+    def enqueue(self, user_id=None, course_id=None):
+        """
+        Ставит запрос в очередь; если слот свободен, он выдаётся сразу
+        """
+        ticket = Ticket(user_id, course_id)
+        users = self._waiting.get(course_id)
+        if users is None:
+            users = self._waiting[course_id] = {}
+            self._course_time[course_id] = max(self._course_time.get(course_id, 0.0), self._course_clock)
+        if user_id not in users:
+            users[user_id] = deque()
+            key = (course_id, user_id)
+            self._user_time[key] = max(self._user_time.get(key, 0.0), self._user_clock.get(course_id, 0.0))
+        users[user_id].append(ticket)
+        self._dispatch()
+        return ticket
+
+    async def wait(self, ticket):
+        try:
+            return await asyncio.shield(ticket.future)
+        except asyncio.CancelledError:
+            if ticket.future.done():
+                # слот уже выдан, но забрать его некому
+                self.release(ticket.future.result(), ticket)
+            else:
+                self._remove(ticket)
+                ticket.future.cancel()
+            raise
+
+    def release(self, item, ticket, held=None):
+        if ticket.user_id in self._running:
+            self._running[ticket.user_id] -= 1
+            if not self._running[ticket.user_id]:
+                del self._running[ticket.user_id]
+        if held is not None:
+            self._service_time = held if self._service_time is None \
+                else 0.9 * self._service_time + 0.1 * held
+        self._free.append(item)
+        self._dispatch()
+
+    def _eligible(self, user_id):
+        return user_id is None or not self.max_per_user or self._running.get(user_id, 0) < self.max_per_user
+
+    def _pick(self):
+        best = None
+        for course_id, users in self._waiting.items():
+            eligible = [user_id for user_id in users if self._eligible(user_id)]
+            if not eligible:
+                continue
+            user_id = min(eligible, key=lambda user_id: self._user_time[(course_id, user_id)])
+            if best is None or self._course_time[course_id] < self._course_time[best[0]]:
+                best = (course_id, user_id)
+        return best
+
+    def _dispatch(self):
+        while self._free:
+            picked = self._pick()
+            if picked is None:
+                return
+            course_id, user_id = picked
+            ticket = self._waiting[course_id][user_id].popleft()
+
+            self._course_clock = self._course_time[course_id]
+            self._course_time[course_id] += 1 / self._weight(course_id)
+            self._user_clock[course_id] = self._user_time[(course_id, user_id)]
+            self._user_time[(course_id, user_id)] += 1
+            self._cleanup(course_id, user_id)
+
+            if user_id is not None:
+                self._running[user_id] = self._running.get(user_id, 0) + 1
+            ticket.future.set_result(self._free.popleft())
+
+    def _remove(self, ticket):
+        queue = self._waiting.get(ticket.course_id, {}).get(ticket.user_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._cleanup(ticket.course_id, ticket.user_id)
+
+    def _cleanup(self, course_id, user_id):
+        # Опустевшие потоки убираем. Виртуальное время не ушедших вперёд
+        # потоков хранить незачем: при возвращении оно всё равно станет равным часам
+        users = self._waiting[course_id]
+        if users[user_id]:
+            return
+        del users[user_id]
+        key = (course_id, user_id)
+        if self._user_time[key] <= self._user_clock.get(course_id, 0.0):
+            del self._user_time[key]
+        if users:
+            return
+        del self._waiting[course_id]
+        if self._course_time[course_id] <= self._course_clock:
+            del self._course_time[course_id]
+            self._user_clock.pop(course_id, None)
+
+    def position(self, ticket):
+        """
+        Оценка места в очереди (1 — следующий). Считается по долям потоков:
+        пока обслуживаются k запросов пользователя, остальные пользователи курса
+        получают столько же, а другие курсы — пропорционально весам
+        """
+        if ticket.ready:
+            return 0
+        users = self._waiting.get(ticket.course_id, {})
+        queue = users.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return 0
+        ahead = queue.index(ticket) + 1
+        in_course = ahead + sum(
+            min(len(other), ahead) for user_id, other in users.items() if user_id != ticket.user_id
+        )
+        weight = self._weight(ticket.course_id)
+        position = in_course + sum(
+            min(sum(len(other) for other in other_users.values()), in_course * self._weight(course_id) / weight)
+            for course_id, other_users in self._waiting.items() if course_id != ticket.course_id
+        )
+        return round(position)
+
+    def estimated_wait(self, ticket):
+        """
+        Оценка ожидания в секундах по среднему времени занятости слота
+        """
+        position = self.position(ticket)
+        if position == 0 or self._service_time is None:
+            return 0.0 if position == 0 else None
+        return position * self._service_time / self.size
@@ -0,0 +1,399 @@
+"""
+Сессии: долгоживущий интерпретатор (sandbox/kernel.py), который исполняет
+ячейки в общем пространстве имён, как ядро Jupyter. Импорты и загруженные
+данные переживают ячейку, так что следующая платит только за своё исполнение.
+
+У каждой сессии свой Unix-пользователь (session1..sessionN), рабочая директория
+и cgroup, поэтому число пользователей — это и предел сессий на сервере.
+Сессия, в которой ничего не запускали дольше SESSION_IDLE_TIMEOUT, закрывается.
+Если для новой сессии нет свободного пользователя или интерпретаторы вместе
+занимают больше SESSIONS_MEMORY, закрываются давно не использованные сессии.
+
+Ячейка на время исполнения занимает место в общем пуле слотов, так что
+справедливая очередь и ограничение одновременных запусков пользователя
+общие с /run. По таймауту ячейка прерывается SIGINT (KeyboardInterrupt);
+если она не остановилась за KILL_GRACE, сессия закрывается.
+
+Между ячейками cgroup сессии заморожена: потоки и процессы, которые ячейка
+оставила после себя, не едят процессор в обход очереди, даже если программа
+подделала ответ в канале управления. Процессорное время интерпретатора
+за всю жизнь сессии ограничено SESSION_CPU_TIME
+"""
+from collections import OrderedDict
+from contextlib import suppress
+from functools import partial
+import asyncio
+import json
+import math
+import os
+import pwd
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+from cgroup import Cgroup, kill_user_processes
+from models import SessionRunResponse
+from output import PipeReader
+from resources import usage_from_proc
+from workspace import WorkspacePool, remove_user_files
+import runner
+
+
+MAX_SESSIONS = int(os.getenv('RUNNER__MAX_SESSIONS', 8))
+SESSION_IDLE_TIMEOUT = float(os.getenv('RUNNER__SESSION_IDLE_TIMEOUT', 600))
+# Процессорное время одного процесса сессии за всю её жизнь, в секундах
+SESSION_CPU_TIME = float(os.getenv('RUNNER__SESSION_CPU_TIME', 300))
+# Суммарный RSS интерпретаторов сессий, сверх которого закрываются давно не использованные
+SESSIONS_MEMORY = int(os.getenv('RUNNER__SESSIONS_MEMORY', 2 * 1024 ** 3))
+SESSIONS_CHECK_INTERVAL = float(os.getenv('RUNNER__SESSIONS_CHECK_INTERVAL', 5))
+
+KERNEL = os.path.join(runner.SANDBOX_DIR, "kernel.py")
+
+
+class SessionsFull(Exception):
+    pass
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionUser:
+    """
+    Пользователь, под которым работает интерпретатор сессии
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.uid = None
+        self.gid = None
+        self.cgroup = None
+
+    def setup(self):
+        entry = pwd.getpwnam(self.name)
+        self.uid, self.gid = entry.pw_uid, entry.pw_gid
+        self.cgroup = Cgroup.create(runner.CGROUP_ROOT, self.name)
+
+    def cleanup(self):
+        if self.cgroup is not None:
+            self.cgroup.kill()
+            # интерпретатор следующей сессии не должен стартовать замороженным
+            self.cgroup.freeze(False)
+        else:
+            kill_user_processes(self.uid)
+        remove_user_files(self.uid)
+
+    def freeze(self, frozen=True):
+        """
+        Заморозка процессов сессии между ячейками; без cgroup ничего не делает
+        """
+        if self.cgroup is not None:
+            self.cgroup.freeze(frozen)
+
+
+class Session:
+    def __init__(self, user: SessionUser, limits: runner.Limits, user_id=None, course_id=None):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.limits = limits
+        self.user_id = user_id
+        self.course_id = course_id
+        self.workspace = None
+        self.process = None
+        self.cells = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+        # ячейки одной сессии исполняются по очереди
+        self.lock = asyncio.Lock()
+        self._control = None
+        self._buffer = b""
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        control_r, control_w = os.pipe()
+        rlimits = self.limits.rlimits()
+        # процессорное время копится за всю жизнь сессии, ячейку ограничивает таймаут
+        cpu_time = math.ceil(SESSION_CPU_TIME)
+        rlimits["RLIMIT_CPU"] = [cpu_time, cpu_time + 1]
+        env = {
+            **runner.sandbox_env(self.workspace.path, self.limits),
+            "PYRUNNER_CONTROL_FD": str(control_w),
+        }
+        try:
+            self.process = subprocess.Popen(
+                [runner.PYTHON, KERNEL],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.workspace.path,
+                env=env,
+                pass_fds=(control_w,),
+                start_new_session=True,
+                preexec_fn=partial(runner.prepare_child, rlimits, self.user.cgroup, self.user.uid, self.user.gid)
+            )
+        except BaseException:
+            os.close(control_r)
+            raise
+        finally:
+            os.close(control_w)
+        self._control = control_r
+
+    def _signal(self, signum):
+        with suppress(ProcessLookupError):
+            os.killpg(self.process.pid, signum)
+
+    def kill(self):
+        """
+        Убивает интерпретатор и всё, что он запустил
+        """
+        self.closed = True
+        if self.process is not None:
+            self._signal(signal.SIGKILL)
+            self.user.cleanup()
+
+    def close(self):
+        """
+        Освобождает ресурсы убитой сессии. Вызывается, когда ячейка не исполняется
+        """
+        self.kill()
+        if self.process is not None:
+            self.process.wait()
+            for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+                with suppress(OSError):
+                    pipe.close()
+        if self._control is not None:
+            os.close(self._control)
+            self._control = None
+
+    def rss(self):
+        if self.process is None:
+            return 0
+        return usage_from_proc(self.process.pid).get("rss", 0)
+
+    def execute(self, code: str, limits: runner.Limits):
+        """
+        Исполнение ячейки. Если интерпретатор завершился (или его пришлось убить),
+        alive после этого False, а returncode — код его завершения
+        """
+        execution = runner.Execution()
+        before = usage_from_proc(self.process.pid)
+        # ответ засчитывается, только если в нём токен этой ячейки
+        token = uuid.uuid4().hex
+        reply = {}
+        reader = PipeReader(
+            self.process.stdout.fileno(),
+            self.process.stderr.fileno(),
+            (limits.max_stdout_size, limits.max_stderr_size)
+        )
+
+        def read_control(fd):
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return True
+            self._buffer += chunk
+            while b"\n" in self._buffer:
+                line, self._buffer = self._buffer.split(b"\n", 1)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and message.get("token") == token:
+                    reply.update(message)
+                    reader.stop()
+                    return False
+            return False
+
+        reader.add(self._control, read_control)
+        execution.started = time.monotonic()
+        self.user.freeze(False)
+        try:
+            try:
+                self.process.stdin.write(json.dumps({"code": code, "token": token}).encode() + b"\n")
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                pass
+            if not reader.read(execution.started + limits.timeout):
+                execution.timed_out = True
+                self._signal(signal.SIGINT)
+                if not reader.read(time.monotonic() + runner.KILL_GRACE):
+                    self.kill()
+                    reader.read()
+        finally:
+            reader.close()
+            # до следующей ячейки всё, что осталось от этой, стоит на месте
+            if not self.closed:
+                self.user.freeze()
+        execution.wall_time = time.monotonic() - execution.started
+        execution.stdout, execution.stderr = bytes(reader.stdout), bytes(reader.stderr)
+        execution.output_sizes = reader.sizes
+
+        if "returncode" in reply:
+            execution.returncode = reply["returncode"]
+            after = usage_from_proc(self.process.pid)
+            if before and after:
+                execution.usage = {
+                    "user_time": round(after["user_time"] - before["user_time"], 4),
+                    "system_time": round(after["system_time"] - before["system_time"], 4),
+                    "max_rss": after["max_rss"],
+                }
+        else:
+            self.kill()
+            self.process.wait()
+            execution.returncode = self.process.returncode
+        return execution
+
+
+class SessionStore:
+    """
+    Открытые сессии, от давно использованных к недавним
+    """
+
+    def __init__(self, users, idle_timeout=SESSION_IDLE_TIMEOUT, max_memory=SESSIONS_MEMORY):
+        self.users = [SessionUser(name) for name in users]
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+        self._free = []
+        self._sessions = OrderedDict()
+        self._workspaces = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def start(self):
+        for user in self.users:
+            try:
+                user.setup()
+                user.cleanup()
+            except KeyError:
+                print(f"sessions: нет пользователя {user.name}, сессий будет меньше", file=sys.stderr)
+                continue
+            self._free.append(user)
+        self._workspaces = WorkspacePool(
+            runner.WORKSPACE_DIR,
+            [user.name for user in self._free],
+            per_user=1,
+            datasets_dir=runner.DATASETS_DIR,
+            on_reset=runner.workspace_reset_seconds.observe
+        )
+        self._workspaces.start()
+
+    def stop(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+        if self._workspaces is not None:
+            self._workspaces.stop()
+        for user in self.users:
+            if user.cgroup is not None:
+                user.cgroup.remove()
+
+    def get(self, session_id) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None or session.closed:
+            raise SessionNotFound(session_id)
+        return session
+
+    async def create(self, limits: runner.Limits, user_id=None, course_id=None) -> Session:
+        # пока закрывалась вытесненная сессия, её пользователя мог занять другой запрос
+        while not self._free:
+            if not await self._evict_one():
+                raise SessionsFull("Too many open sessions, try again later")
+        user = self._free.pop()
+        session = Session(user, limits, user_id, course_id)
+        try:
+            session.workspace = await asyncio.to_thread(self._workspaces.acquire, user.name)
+            await asyncio.to_thread(session.start)
+        except BaseException:
+            await asyncio.to_thread(session.close)
+            self._release(session)
+            raise
+        self._sessions[session.id] = session
+        return session
+
+    async def run(self, session_id, code: str, limits: runner.Limits) -> SessionRunResponse:
+        session = self.get(session_id)
+        async with session.lock:
+            if session.closed:
+                raise SessionNotFound(session_id)
+            self._sessions.move_to_end(session_id)
+            result = await runner.check_syntax(code)
+            if result is not None:
+                runner.runs_total.inc(outcome="syntax_error")
+            else:
+                # слот здесь — только место в общей очереди: ячейка исполняется в интерпретаторе сессии
+                async with runner.slot_pool.acquire(session.user_id, session.course_id):
+                    future = asyncio.get_running_loop().run_in_executor(
+                        runner.executor, session.execute, code, limits
+                    )
+                    try:
+                        execution = await asyncio.shield(future)
+                    except asyncio.CancelledError:
+                        # клиент ушёл: сессию с недоисполненной ячейкой не вернуть в известное состояние
+                        session.kill()
+                        with suppress(Exception):
+                            await future
+                        raise
+                session.cells += 1
+                if execution.timed_out:
+                    runner.runs_total.inc(outcome="timeout")
+                else:
+                    runner.runs_total.inc(outcome="success" if execution.returncode == 0 else "nonzero")
+                result = runner.build_response(execution, limits)
+            session.last_used = time.monotonic()
+        alive = session.alive and not session.closed
+        if not alive:
+            await self.close(session_id)
+        return SessionRunResponse(**result.model_dump(), session_alive=alive)
+
+    async def close(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise SessionNotFound(session_id)
+        # исполняющаяся ячейка завершится, как только умрёт интерпретатор
+        session.kill()
+        async with session.lock:
+            await asyncio.to_thread(session.close)
+        self._release(session)
+
+    def _release(self, session: Session):
+        if session.workspace is not None:
+            self._workspaces.release(session.workspace)
+        self._free.append(session.user)
+
+    def _least_recent_idle(self):
+        # давно не использованная сессия, в которой сейчас ничего не исполняется
+        return next((session for session in self._sessions.values() if not session.lock.locked()), None)
+
+    async def _evict_one(self):
+        session = self._least_recent_idle()
+        if session is None:
+            return False
+        await self.close(session.id)
+        return True
+
+    async def maintain(self):
+        """
+        Закрывает простаивающие сессии и, пока интерпретаторы занимают
+        больше max_memory, давно не использованные
+        """
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if not session.lock.locked() and now - session.last_used > self.idle_timeout:
+                with suppress(SessionNotFound):
+                    await self.close(session_id)
+        memory = sum(session.rss() for session in self._sessions.values())
+        while memory > self.max_memory:
+            session = self._least_recent_idle()
+            if session is None:
+                break
+            memory -= session.rss()
+            await self.close(session.id)
+
+
+session_store = SessionStore([f"session{index}" for index in range(1, MAX_SESSIONS + 1)])
+runner.metrics.gauge("runner_sessions", "Open interpreter sessions", function=lambda: len(session_store))
@@ -0,0 +1,127 @@
+"""
+Индекс проверок задач для GET /task_checks.
+
+Дерево упражнений имеет ту же структуру, что и каталог exercises/modules
+пакета cupychecker: module_X/tasks/task_Y.yaml. По умолчанию берётся
+дерево из установленного пакета (см. package_root). Индекс строится один раз при старте, ответы
+(уже сериализованный JSON и его ETag) хранятся в памяти. Фоновая задача
+периодически сверяет время изменения и размер файлов и перечитывает
+только изменившиеся
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import threading
+
+import yaml
+
+
+MODULE_DIR = re.compile(r"^module_(.+)$")
+TASK_FILE = re.compile(r"^task_(.+)\.ya?ml$")
+
+
+def package_root():
+    """
+    Дерево упражнений установленного пакета cupychecker или None, если пакета нет
+    """
+    spec = importlib.util.find_spec("cupychecker")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(next(iter(spec.submodule_search_locations)), "exercises", "modules")
+
+
+class TaskEntry:
+    """
+    Проверки одной задачи в виде готового ответа
+    """
+
+    def __init__(self, signature, data, body):
+        # (st_mtime_ns, st_size) файла, по которым определяется изменение
+        self.signature = signature
+        # разобранный YAML (для /check)
+        self.data = data
+        # готовое тело ответа {"data": ...}
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+class TaskIndex:
+    """
+    (module, task) -> TaskEntry для всех YAML в дереве упражнений
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._entries = {}  # (module, task) -> TaskEntry
+        self._lock = threading.Lock()
+
+    def _files(self):
+        try:
+            modules = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for module_dir in modules:
+            module = MODULE_DIR.match(module_dir)
+            tasks_dir = os.path.join(self.root, module_dir, "tasks")
+            if module is None or not os.path.isdir(tasks_dir):
+                continue
+            for file in os.listdir(tasks_dir):
+                task = TASK_FILE.match(file)
+                if task is not None:
+                    yield (module.group(1), task.group(1)), os.path.join(tasks_dir, file)
+
+    def refresh(self):
+        """
+        Приводит индекс в соответствие с файлами. Возвращает число изменившихся задач
+        """
+        entries = {}
+        changed = 0
+        for key, path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+
+            entry = self._entries.get(key)
+            if entry is None or entry.signature != signature:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        data = yaml.safe_load(f)
+                except (OSError, yaml.YAMLError) as err:
+                    # битый файл не роняет индекс, до исправления отдаётся прежняя версия
+                    print(f"tasks: не удалось прочитать {path}: {err}", file=sys.stderr)
+                    if entry is not None:
+                        entries[key] = entry
+                    continue
+                entry = TaskEntry(signature, data, json.dumps({"data": data}, ensure_ascii=False).encode("utf-8"))
+                changed += 1
+            entries[key] = entry
+
+        changed += len(self._entries.keys() - entries.keys())
+        with self._lock:
+            self._entries = entries
+        return changed
+
+    def get(self, module, task):
+        with self._lock:
+            return self._entries.get((module, task))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Проверка заголовка If-None-Match (список тегов через запятую, * или W/"...")
+    """
+    if if_none_match is None:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
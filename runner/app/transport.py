@@ -0,0 +1,222 @@
+"""
+Согласование формата и сжатия тел запросов и ответов.
+
+Эндпоинты работают с JSON, а middleware на входе и выходе перекодирует:
+- тело запроса с Content-Type: application/msgpack превращается в JSON,
+  тело с Content-Encoding: gzip или zstd распаковывается;
+- JSON-ответ отдаётся в msgpack, если клиент указал application/msgpack в Accept,
+  и сжимается (zstd, если есть модуль zstandard, иначе gzip), если клиент
+  это принимает (Accept-Encoding) и ответ не меньше COMPRESS_MIN_SIZE байт.
+
+Потоковые ответы (Server-Sent Events) проходят как есть: сжатие задержало
+бы доставку вывода. По умолчанию — обычный JSON без сжатия
+"""
+import gzip
+import json
+import os
+import zlib
+
+import msgpack
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MSGPACK = "application/msgpack"
+COMPRESS_MIN_SIZE = int(os.getenv('RUNNER__COMPRESS_MIN_SIZE', 1024))
+# Предел тела сжатого или msgpack-запроса после распаковки: маленькое сжатое тело
+# может развернуться в гигабайты
+MAX_BODY_SIZE = int(os.getenv('RUNNER__MAX_BODY_SIZE', 64 * 1024 * 1024))
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+DECOMPRESS_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def _accepts(header, value):
+    """
+    Есть ли value в заголовке вида Accept/Accept-Encoding (q=0 означает отказ)
+    """
+    for item in header.split(","):
+        name, *params = item.split(";")
+        if name.strip().lower() != value:
+            continue
+        for param in params:
+            key, _, weight = param.strip().partition("=")
+            if key == "q":
+                try:
+                    return float(weight) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def encodings():
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def decompress(data: bytes, encoding: str, max_size=MAX_BODY_SIZE):
+    """
+    Распаковка тела запроса; ValueError, если оно повреждено или сжато неизвестно чем,
+    BodyTooLarge, если распакованное тело больше max_size
+    """
+    try:
+        if encoding == "zstd" and zstandard is not None:
+            # размер распакованных данных может быть не записан в кадре, поэтому читаем по частям
+            body = bytearray()
+            with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+                while chunk := reader.read(64 * 1024):
+                    body += chunk
+                    if len(body) > max_size:
+                        raise BodyTooLarge("Decompressed request body is too large")
+            return bytes(body)
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = decompressor.decompress(data, max_size + 1)
+            if len(body) > max_size:
+                raise BodyTooLarge("Decompressed request body is too large")
+            if not decompressor.eof:
+                raise ValueError("Compressed file ended before the end-of-stream marker was reached")
+            return body
+    except DECOMPRESS_ERRORS as err:
+        raise ValueError(str(err)) from err
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+class TransportMiddleware:
+    def __init__(self, app, min_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_type == MSGPACK or content_encoding != "identity":
+            try:
+                body = await self._decode_request(receive, content_type, content_encoding)
+            except BodyTooLarge as err:
+                await self._reject(send, str(err), status=413)
+                return
+            except (ValueError, TypeError, msgpack.UnpackException) as err:
+                await self._reject(send, f"Malformed request body: {str(err) or type(err).__name__}")
+                return
+            request_headers = MutableHeaders(scope=scope)
+            del request_headers["content-encoding"]
+            request_headers["content-length"] = str(len(body))
+            if content_type == MSGPACK:
+                request_headers["content-type"] = "application/json"
+            receive = self._replay(body, receive)
+
+        accept = headers.get("accept", "")
+        accept_encoding = headers.get("accept-encoding", "")
+        use_msgpack = _accepts(accept, MSGPACK)
+        encoding = next((name for name in encodings() if _accepts(accept_encoding, name)), None)
+        if not use_msgpack and encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, self._encoder(send, use_msgpack, encoding))
+
+    @staticmethod
+    async def _decode_request(receive, content_type, content_encoding):
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_SIZE:
+                raise BodyTooLarge("Request body is too large")
+            if not message.get("more_body", False):
+                break
+        body = bytes(body)
+        if content_encoding != "identity":
+            body = decompress(body, content_encoding, MAX_BODY_SIZE)
+        if content_type == MSGPACK:
+            body = json.dumps(msgpack.unpackb(body, raw=False), ensure_ascii=False).encode("utf-8")
+        return body
+
+    @staticmethod
+    def _replay(body, receive):
+        """
+        Отдаёт приложению перекодированное тело, а дальше — сообщения клиента:
+        по http.disconnect потоковые ответы узнают, что клиент ушёл
+        """
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return replay
+
+    @staticmethod
+    async def _reject(send, detail, status=400):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _encoder(self, send, use_msgpack, encoding):
+        """
+        Обёртка над send: JSON-ответ собирается целиком и перекодируется,
+        остальные передаются без изменений
+        """
+        start = None
+        body = bytearray()
+        passthrough = False
+
+        async def wrapped(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if content_type != "application/json" or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body.extend(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            content = bytes(body)
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if use_msgpack and content:
+                content = msgpack.packb(json.loads(content), use_bin_type=True)
+                headers["content-type"] = MSGPACK
+            if encoding is not None and len(content) >= self.min_size:
+                content = compress(content, encoding)
+                headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(content))
+            headers.add_vary_header("Accept")
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": content})
+
+        return wrapped
@@ -0,0 +1,149 @@
+"""
+Пул заранее подготовленных рабочих директорий.
+
+У каждого пользователя слота несколько директорий, которые уже принадлежат
+ему и содержат ссылку на датасеты, — на запрос остаётся только записать main.py.
+После запуска директория уходит фоновому потоку, который удаляет её целиком
+и создаёт заново; в пул она возвращается только после этого, поэтому
+следующая программа никогда не видит файлов предыдущей.
+
+Своих домашних директорий у пользователей слотов нет: HOME и TMPDIR программы
+указывают внутрь рабочей директории. Файлы, которые программа всё же оставила
+в общих временных каталогах (/tmp и т.п.), удаляет remove_user_files,
+пока слот ещё не отдан следующему запуску.
+
+Корень пула лучше держать на tmpfs с ограничением размера
+(например, docker run --tmpfs /app/workspaces:size=512m и RUNNER__WORKSPACE_DIR=workspaces)
+"""
+import os
+import pwd
+import queue
+import shutil
+import sys
+import threading
+import time
+
+# Поддиректория рабочей директории для временных файлов программы (TMPDIR)
+TMP_DIRECTORY = "tmp"
+# Общие каталоги, куда пользователь слота может писать в обход TMPDIR
+SHARED_TMP_DIRS = ("/tmp", "/var/tmp", "/dev/shm")
+
+class Workspace:
+    """
+    Рабочая директория пользователя слота
+    """
+
+    def __init__(self, user, path):
+        self.user = user
+        self.path = path
+
+
+class WorkspacePool:
+    """
+    По per_user директорий на каждого пользователя и фоновый поток очистки
+    """
+
+    def __init__(self, root, users, per_user=2, datasets_dir="datasets", on_reset=None):
+        self.root = root
+        self.users = list(users)
+        self.per_user = per_user
+        self.datasets_dir = os.path.abspath(datasets_dir)
+        # on_reset(seconds) — для метрик
+        self._on_reset = on_reset
+        self._ready = {user: queue.Queue() for user in self.users}
+        self._dirty = queue.Queue()
+        self._counter = 0
+        self._thread = None
+
+    def start(self):
+        for user in self.users:
+            user_dir = os.path.join(self.root, user)
+            # от прошлого запуска сервера могли остаться грязные директории
+            shutil.rmtree(user_dir, ignore_errors=True)
+            os.makedirs(user_dir)
+            for _ in range(self.per_user):
+                self._ready[user].put(self._create(user))
+
+        self._thread = threading.Thread(target=self._loop, name="workspace-reset", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._dirty.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def acquire(self, user):
+        """
+        Чистая директория пользователя. Блокирует, пока фоновый поток
+        не вернёт в пул хотя бы одну
+        """
+        return self._ready[user].get()
+
+    def release(self, workspace):
+        """
+        Возврат директории после запуска. Процессы пользователя к этому
+        моменту должны быть убиты, иначе они могут писать в неё во время очистки
+        """
+        self._dirty.put(workspace)
+
+    def _create(self, user):
+        self._counter += 1
+        path = os.path.abspath(os.path.join(self.root, user, f"ws{self._counter}"))
+        workspace = Workspace(user, path)
+        self._prepare(workspace)
+        return workspace
+
+    def _prepare(self, workspace):
+        entry = pwd.getpwnam(workspace.user)
+        os.mkdir(workspace.path, 0o700)
+        os.chown(workspace.path, entry.pw_uid, entry.pw_gid)
+        os.symlink(self.datasets_dir, os.path.join(workspace.path, "datasets"))
+        tmp = os.path.join(workspace.path, TMP_DIRECTORY)
+        os.mkdir(tmp, 0o700)
+        os.chown(tmp, entry.pw_uid, entry.pw_gid)
+
+    def _reset(self, workspace):
+        # Удаляем директорию целиком, а не только содержимое: студент мог
+        # поменять права на саму директорию
+        shutil.rmtree(workspace.path)
+        self._prepare(workspace)
+
+    def _loop(self):
+        while (workspace := self._dirty.get()) is not None:
+            started = time.monotonic()
+            try:
+                self._reset(workspace)
+            except OSError as err:
+                # директорию в пул не возвращаем, взамен заводим новую
+                print(f"workspace: не удалось очистить {workspace.path}: {err}", file=sys.stderr)
+                try:
+                    workspace = self._create(workspace.user)
+                except OSError as err:
+                    print(f"workspace: не удалось создать директорию: {err}", file=sys.stderr)
+                    continue
+            self._ready[workspace.user].put(workspace)
+            if self._on_reset is not None:
+                self._on_reset(time.monotonic() - started)
+
+
+def remove_user_files(uid, dirs=SHARED_TMP_DIRS):
+    """
+    Удаляет из общих временных каталогов всё, что принадлежит пользователю.
+    Вызывается после того, как его процессы убиты
+    """
+    for path in dirs:
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.stat(follow_symlinks=False).st_uid != uid:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            except OSError as err:
+                print(f"workspace: не удалось удалить {entry.path}: {err}", file=sys.stderr)
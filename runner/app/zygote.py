@@ -0,0 +1,428 @@
+"""
+Fork-server («зигота») для запуска кода студентов.
+
+Привилегированный процесс один раз импортирует тяжёлые библиотеки
+(pandas, numpy, matplotlib), а затем на каждый запуск делает fork:
+дочерний процесс сбрасывает привилегии до пользователя слота, переходит
+в рабочую директорию и исполняет main.py. Импорт библиотек в коде студента
+после этого ничего не стоит — модули уже лежат в sys.modules.
+
+Протокол (Unix-сокет, по строке JSON на сообщение):
+    клиент -> зигота: {"user", "cwd", "path", "env", "rlimits", "cgroup"} + дескрипторы stdout/stderr (SCM_RIGHTS)
+    зигота -> клиент: {"pid": ...}, затем по завершении {"returncode": ..., "usage": {...}}
+"""
+import atexit
+import builtins
+import ctypes
+import importlib
+import io
+import json
+import os
+import pwd
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import types
+
+from cgroup import Cgroup
+from output import PipeReader
+from resources import apply_rlimits, usage_from_rusage
+
+
+PRELOAD = os.getenv('RUNNER__PRELOAD', 'numpy,pandas,matplotlib,matplotlib.pyplot')
+SOCKET_PATH = os.getenv('RUNNER__ZYGOTE_SOCKET', '/tmp/pyrunner-zygote.sock')
+START_TIMEOUT = 120
+# Сколько ждать от зиготы кода завершения убитого по таймауту процесса
+KILL_WAIT = 1
+PR_SET_CHILD_SUBREAPER = 36
+# Модули для программ студентов; в режиме subprocess они подключаются через PYTHONPATH
+SANDBOX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox')
+SITECUSTOMIZE = os.path.join(SANDBOX_DIR, 'sitecustomize.py')
+
+
+# ---------------------------------------------------------------------------
+# Серверная часть (живёт в отдельном процессе)
+# ---------------------------------------------------------------------------
+
+def preload(modules):
+    """
+    Импорт тяжёлых библиотек заранее, до первого fork
+    """
+    # В песочнице нет дисплея
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for name in modules:
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            importlib.import_module(name)
+        except ImportError as err:
+            print(f"zygote: не удалось импортировать {name}: {err}", file=sys.stderr)
+
+
+def _run_main(path):
+    """
+    Исполнение main.py так же, как это делает `python3 main.py`.
+    Возвращает код завершения
+    """
+    module = types.ModuleType('__main__')
+    module.__file__ = path
+    module.__builtins__ = builtins
+    sys.modules['__main__'] = module
+
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+        exec(compile(source, path, 'exec'), module.__dict__)
+        return 0
+    except SystemExit as exc:
+        if exc.code is None:
+            return 0
+        if isinstance(exc.code, int):
+            return exc.code
+        print(exc.code, file=sys.stderr)
+        return 1
+    except BaseException as exc:
+        # Первый кадр — этот модуль, студенту он не нужен
+        tb = exc.__traceback__.tb_next if exc.__traceback__ else None
+        traceback.print_exception(type(exc), exc, tb)
+        return 1
+
+
+def _seed_random():
+    """
+    После fork все дети наследуют состояние numpy.random от зиготы
+    (random переинициализируется сам через os.register_at_fork)
+    """
+    numpy_random = sys.modules.get('numpy.random')
+    if numpy_random is not None:
+        numpy_random.seed()
+    # В детерминированном режиме sitecustomize снова фиксирует seed
+    if os.path.exists(SITECUSTOMIZE):
+        with open(SITECUSTOMIZE, 'rb') as f:
+            exec(compile(f.read(), SITECUSTOMIZE, 'exec'), {'__name__': 'sitecustomize'})
+
+
+def _child(request, stdout_fd, stderr_fd):
+    """
+    Код дочернего процесса после fork. Никогда не возвращается
+    """
+    status = 1
+    try:
+        os.setsid()
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        # Сокеты и служебные дескрипторы зиготы студенту недоступны
+        os.closerange(3, os.sysconf('SC_OPEN_MAX'))
+
+        sys.stdin = sys.__stdin__ = io.TextIOWrapper(io.FileIO(0, 'r', closefd=False), encoding='utf-8')
+        sys.stdout = sys.__stdout__ = io.TextIOWrapper(io.FileIO(1, 'w', closefd=False), encoding='utf-8')
+        sys.stderr = sys.__stderr__ = io.TextIOWrapper(
+            io.FileIO(2, 'w', closefd=False), encoding='utf-8', errors='backslashreplace', line_buffering=True
+        )
+
+        apply_rlimits(request.get('rlimits', {}))
+        if request.get('cgroup'):
+            Cgroup(request['cgroup']).add()
+
+        user = pwd.getpwnam(request['user'])
+        os.setgroups([])
+        os.setgid(user.pw_gid)
+        os.setuid(user.pw_uid)
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request.get('env', {}))
+        # каталог для временных файлов мог закэшироваться при предзагрузке модулей
+        if 'tempfile' in sys.modules:
+            sys.modules['tempfile'].tempdir = None
+        sys.argv = [request['path']]
+        sys.path[0] = request['cwd']
+        sys.path.insert(1, SANDBOX_DIR)
+        # Обработчики выхода зиготы студенту не принадлежат;
+        # свои (сохранение графиков) регистрирует sitecustomize
+        atexit._clear()
+        _seed_random()
+        status = _run_main(request['path'])
+        atexit._run_exitfuncs()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+        os._exit(status)
+
+
+def _send(conn, message):
+    try:
+        conn.sendall(json.dumps(message).encode() + b'\n')
+    except OSError:
+        pass
+
+
+def serve(path=SOCKET_PATH):
+    """
+    Главный цикл зиготы: принимает запросы и форкает дочерние процессы.
+    Процесс однопоточный — это обязательное условие для безопасного fork
+    """
+    preload(PRELOAD.split(','))
+
+    # Осиротевшие потомки студенческих программ переходят к зиготе,
+    # а не к PID 1, и зигота их добивает и забирает
+    ctypes.CDLL(None, use_errno=True).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o600)
+    listener.listen(128)
+
+    # SIGCHLD будит select через self-pipe
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+
+    children = {}  # pid -> соединение клиента
+
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is listener:
+                conn, _ = listener.accept()
+                try:
+                    data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+                    request = json.loads(data)
+                except (OSError, ValueError):
+                    conn.close()
+                    continue
+                if len(fds) != 2:
+                    for fd in fds:
+                        os.close(fd)
+                    conn.close()
+                    continue
+
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    _child(request, *fds)
+
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                _send(conn, {'pid': pid})
+            else:
+                try:
+                    os.read(wakeup_r, 4096)
+                except BlockingIOError:
+                    pass
+
+        # Забираем завершившиеся процессы, включая осиротевших потомков
+        while True:
+            try:
+                pid, status, rusage = os.wait4(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            conn = children.pop(pid, None)
+            if conn is not None:
+                _send(conn, {
+                    'returncode': os.waitstatus_to_exitcode(status),
+                    'usage': usage_from_rusage(rusage),
+                })
+                conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Клиентская часть (используется runner.py)
+# ---------------------------------------------------------------------------
+
+class ZygoteProcess:
+    """
+    Процесс студента, порождённый зиготой. Интерфейс повторяет subprocess.Popen
+    в том объёме, который нужен runner.py
+    """
+
+    def __init__(self, conn, pid, stdout_fd, stderr_fd):
+        self._conn = conn
+        self._buffer = b''
+        self.pid = pid
+        self.returncode = None
+        # потребление ресурсов (см. resources.usage_from_rusage), приходит вместе с кодом завершения
+        self.usage = {}
+        # полный объём вывода в байтах, включая отброшенное сверх лимитов
+        self.output_sizes = {'stdout': 0, 'stderr': 0}
+        self._stdout_fd = stdout_fd
+        self._stderr_fd = stderr_fd
+
+    def kill(self, signum=signal.SIGKILL):
+        # Дочерний процесс сделал setsid, pgid == pid
+        try:
+            os.killpg(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _parse_control(self):
+        if b'\n' not in self._buffer:
+            return False
+        message = json.loads(self._buffer.split(b'\n')[0])
+        self.returncode = message['returncode']
+        self.usage = message.get('usage', {})
+        return True
+
+    def _read_control(self, conn):
+        chunk = conn.recv(4096)
+        if chunk:
+            self._buffer += chunk
+        return self._parse_control() or not chunk
+
+    def _wait_control(self, timeout):
+        """
+        Дожидается кода завершения после kill, чтобы не потерять rusage
+        """
+        self._conn.settimeout(timeout)
+        try:
+            while not self._parse_control():
+                chunk = self._conn.recv(4096)
+                if not chunk:
+                    break
+                self._buffer += chunk
+        except OSError:
+            pass
+
+    def communicate(self, timeout=None, limits=(None, None), on_output=None, grace=0):
+        """
+        Читает stdout/stderr до закрытия и ждёт код завершения.
+        По таймауту посылает группе процессов SIGTERM, через grace секунд — SIGKILL,
+        и бросает subprocess.TimeoutExpired с выводом, прочитанным до этого момента
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        reader = PipeReader(self._stdout_fd, self._stderr_fd, limits, on_output)
+        if not self._parse_control():
+            reader.add(self._conn, self._read_control)
+
+        try:
+            if not reader.read(deadline):
+                if grace:
+                    self.kill(signal.SIGTERM)
+                    reader.read(time.monotonic() + grace)
+                self.kill()
+                if self.returncode is None:
+                    self._wait_control(KILL_WAIT)
+                raise subprocess.TimeoutExpired(self.pid, timeout, bytes(reader.stdout), bytes(reader.stderr))
+        finally:
+            self.output_sizes = reader.sizes
+            reader.close()
+            os.close(self._stdout_fd)
+            os.close(self._stderr_fd)
+            self._conn.close()
+
+        return bytes(reader.stdout), bytes(reader.stderr)
+
+
+class Zygote:
+    """
+    Управление процессом зиготы со стороны runner.py: запуск, перезапуск, fork
+    """
+
+    def __init__(self, path=SOCKET_PATH, env=None):
+        self.path = path
+        # дополнительные переменные окружения зиготы: то, что дети наследуют
+        # при fork и что нельзя поменять после старта (PYTHONHASHSEED, число потоков BLAS)
+        self.env = env or {}
+        self._process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        env = {**os.environ, **self.env}
+        self._process = subprocess.Popen([sys.executable, os.path.abspath(__file__), self.path], env=env)
+
+        # Ждём, пока зигота импортирует библиотеки и откроет сокет
+        deadline = time.monotonic() + START_TIMEOUT
+        while not os.path.exists(self.path):
+            if self._process.poll() is not None:
+                raise RuntimeError(f"zygote exited with code {self._process.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError("zygote did not start in time")
+            time.sleep(0.05)
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.terminate()
+                self._process.wait()
+            self._process = None
+
+    def spawn(self, user, cwd, path, env, rlimits=None, cgroup=None):
+        """
+        Форкает процесс студента. Возвращает ZygoteProcess
+        """
+        with self._lock:
+            # Зигота упала — поднимаем заново
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+            request = {
+                'user': user,
+                'cwd': cwd,
+                'path': path,
+                'env': env,
+                'rlimits': rlimits or {},
+                'cgroup': cgroup,
+            }
+            socket.send_fds(conn, [json.dumps(request).encode()], [stdout_w, stderr_w])
+
+            buffer = b''
+            while b'\n' not in buffer:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    raise RuntimeError("zygote closed connection")
+                buffer += chunk
+        except BaseException:
+            conn.close()
+            os.close(stdout_r)
+            os.close(stderr_r)
+            raise
+        finally:
+            os.close(stdout_w)
+            os.close(stderr_w)
+
+        line, rest = buffer.split(b'\n', 1)
+        process = ZygoteProcess(conn, json.loads(line)['pid'], stdout_r, stderr_r)
+        process._buffer = rest
+        return process
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH)
@@ -0,0 +1,263 @@
+"""
+Нагрузочный тест runner: сколько программ в минуту выдерживает один экземпляр
+и какие у них задержки.
+
+Запускает runner локально (или берёт уже запущенный, --url) и для каждого
+уровня параллельности прогоняет набор нагрузок: печать, импорт pandas,
+счёт на процессоре, таймаут и большой вывод. По каждой нагрузке считает
+пропускную способность, задержки p50/p95/p99 на клиенте и накладные расходы
+по фазам из /metrics runner (ожидание слота, подготовка, исполнение, очистка).
+Результат пишется в JSON; с --compare печатается сравнение с прошлым прогоном,
+например с другого коммита.
+
+Запуск из директории runner под root (слотам нужны пользователи student1..N):
+    python bench.py --concurrency 1,4,8 --requests 50 --output bench.json
+    python bench.py --output new.json --compare bench.json
+Переменные RUNNER__* передаются запущенному runner как есть
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORKLOADS = {
+    "print": {"code": "print('hello')"},
+    "pandas_import": {"code": "import pandas as pd\nprint(pd.__version__)"},
+    "cpu_loop": {"code": "total = 0\nfor i in range(2_000_000):\n    total += i * i\nprint(total)"},
+    "timeout": {"code": "while True:\n    pass", "timeout": 1},
+    "large_output": {"code": "for i in range(100_000):\n    print(i, 'x' * 40)"},
+}
+# Фазы запуска и гистограммы runner, из которых считаются их средние
+PHASES = {
+    "queue_wait": "runner_queue_wait_seconds",
+    "setup": "runner_setup_seconds",
+    "execution": "runner_execution_seconds",
+    "cleanup": "runner_cleanup_seconds",
+}
+
+
+def percentile(values, q):
+    """
+    Перцентиль по методу ближайшего ранга
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def parse_metrics(text):
+    """
+    {имя: значение} для сэмплов без меток из текстового формата Prometheus
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        if value:
+            samples[name] = float(value)
+    return samples
+
+
+def phase_means(before, after):
+    """
+    Средняя длительность каждой фазы между двумя снимками /metrics, в секундах
+    """
+    means = {}
+    for phase, metric in PHASES.items():
+        count = after.get(f"{metric}_count", 0) - before.get(f"{metric}_count", 0)
+        total = after.get(f"{metric}_sum", 0) - before.get(f"{metric}_sum", 0)
+        means[phase] = round(total / count, 6) if count else None
+    return means
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_runner(port):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", "app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"runner exited with code {process.returncode}")
+        try:
+            if httpx.get(url + "/health", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("runner did not become healthy in 60 seconds")
+
+
+async def _metrics(client, url):
+    response = await client.get(url + "/metrics")
+    response.raise_for_status()
+    return parse_metrics(response.text)
+
+
+async def run_workload(client, url, name, concurrency, requests):
+    """
+    requests запусков нагрузки name, не больше concurrency одновременно
+    """
+    # повторы одной программы не должны отдаваться из кэша
+    body = {**WORKLOADS[name], "cache": False}
+    latencies = []
+    outcomes = {}
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url + "/run", json=body)
+                if response.status_code != 200:
+                    outcome = f"http_{response.status_code}"
+                else:
+                    result = response.json()
+                    outcome = "timeout" if result["timeout"] else f"exit_{result['return_code']}"
+            except httpx.HTTPError as err:
+                outcome = type(err).__name__
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    before = await _metrics(client, url)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    after = await _metrics(client, url)
+
+    return {
+        "workload": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed": round(elapsed, 4),
+        "throughput_per_second": round(requests / elapsed, 3),
+        "throughput_per_minute": round(requests / elapsed * 60, 1),
+        "latency": {
+            "mean": round(sum(latencies) / len(latencies), 6),
+            "p50": round(percentile(latencies, 50), 6),
+            "p95": round(percentile(latencies, 95), 6),
+            "p99": round(percentile(latencies, 99), 6),
+            "max": round(max(latencies), 6),
+        },
+        "phases": phase_means(before, after),
+        "outcomes": outcomes,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(url, workloads, levels, requests, warmup):
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120)) as client:
+        # первые запуски прогревают зиготу, кэши ОС и пул директорий
+        for name in workloads:
+            for _ in range(warmup):
+                await client.post(url + "/run", json={**WORKLOADS[name], "cache": False})
+
+        results = []
+        for concurrency in levels:
+            for name in workloads:
+                result = await run_workload(client, url, name, concurrency, requests)
+                results.append(result)
+                latency = result["latency"]
+                print(
+                    f"{name:>14} x{concurrency:<3} {result['throughput_per_minute']:>9.1f}/min  "
+                    f"p50 {latency['p50'] * 1000:8.1f} ms  p95 {latency['p95'] * 1000:8.1f} ms  "
+                    f"p99 {latency['p99'] * 1000:8.1f} ms  {result['outcomes']}",
+                    file=sys.stderr
+                )
+        return results
+
+
+def compare(results, baseline):
+    """
+    Изменение пропускной способности и p95 относительно прошлого прогона
+    """
+    previous = {(item["workload"], item["concurrency"]): item for item in baseline["results"]}
+    print(f"compared with {baseline.get('commit') or 'baseline'}:")
+    for item in results:
+        old = previous.get((item["workload"], item["concurrency"]))
+        if old is None:
+            continue
+        throughput = item["throughput_per_second"] / old["throughput_per_second"] - 1
+        p95 = item["latency"]["p95"] / old["latency"]["p95"] - 1
+        print(f"{item['workload']:>14} x{item['concurrency']:<3} throughput {throughput:+7.1%}  p95 {p95:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="уже запущенный runner; по умолчанию запускается локальный")
+    parser.add_argument("--concurrency", default="1,4", help="уровни параллельности через запятую")
+    parser.add_argument("--requests", type=int, default=20, help="запусков каждой нагрузки на каждом уровне")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="нагрузки через запятую")
+    parser.add_argument("--warmup", type=int, default=1, help="прогревочных запусков каждой нагрузки")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--compare", help="результаты прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_runner(_free_port())
+    try:
+        results = asyncio.run(benchmark(url.rstrip("/"), workloads, levels, args.requests, args.warmup))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "runner": {name: value for name, value in os.environ.items() if name.startswith("RUNNER__")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
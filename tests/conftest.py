@@ -7,6 +7,9 @@ import os
 
 # Добавляем путь к модулю cupychecker в sys.path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cupychecker'))
+# Модули runner (scheduler, coalesce, transport) импортируются так же, как внутри runner/app;
+# в конец пути, чтобы его models.py и tasks.py ничего не перекрывали
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'runner', 'app'))
 
 @pytest.fixture
 def sample_code():
@@ -4,7 +4,7 @@
 import pytest
 from unittest.mock import Mock, patch
 import requests
-from cupychecker.checker import run_code, check_result
+from cupychecker.checker import run_code, check_result, check_code, check_syntax, submit_job, get_job
 
 
 class TestRunCode:
@@ -55,6 +55,189 @@ class TestRunCode:
         with pytest.raises(requests.HTTPError):
             run_code("print('hello')")
 
+    @patch('cupychecker.checker.requests.post')
+    def test_run_code_plots(self, mock_post):
+        """Тест запроса графиков: они приходят в поле artifacts"""
+        artifact = {"name": "001.png", "mime_type": "image/png", "sha256": "ab", "size": 3, "data": "iVBO"}
+        mock_response = Mock()
+        mock_response.json.return_value = {"stdout": "", "stderr": "", "artifacts": [artifact]}
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        result = run_code("plt.show()", plots='png')
+
+        assert result["artifacts"] == [artifact]
+        mock_post.assert_called_once_with(
+            'http://localhost:8000/run',
+            json={'code': "plt.show()", 'plots': 'png'}
+        )
+
+    @patch('cupychecker.checker.requests.post')
+    def test_run_code_binary(self, mock_post):
+        """Тест обмена в msgpack: тело запроса и ответа не в JSON"""
+        msgpack = pytest.importorskip("msgpack")
+        mock_response = Mock()
+        mock_response.headers = {'Content-Type': 'application/msgpack'}
+        mock_response.content = msgpack.packb({"stdout": "hello\n", "stderr": "", "return_code": 0})
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        result = run_code("print('hello')", binary=True)
+
+        assert result == {"stdout": "hello\n", "stderr": "", "return_code": 0}
+        mock_post.assert_called_once_with(
+            'http://localhost:8000/run',
+            data=msgpack.packb({'code': "print('hello')"}),
+            headers={'Content-Type': 'application/msgpack', 'Accept': 'application/msgpack'}
+        )
+
+    @patch('cupychecker.checker.requests.post')
+    def test_run_code_stream(self, mock_post):
+        """Тест потокового выполнения кода через /run/stream"""
+        mock_response = Mock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.iter_lines.return_value = [
+            b'event: stdout',
+            'data: {"text": "привет\\n"}'.encode('utf-8'),
+            b'',
+            b'event: stderr',
+            b'data: {"text": "warning\\n"}',
+            b'',
+            b'event: stdout',
+            b'data: {"text": "2\\n"}',
+            b'',
+            b'event: result',
+            b'data: {"return_code": 0, "timeout": false}',
+            b'',
+        ]
+        mock_post.return_value = mock_response
+        chunks = []
+
+        result = run_code(
+            "print('привет')",
+            stream=True,
+            on_output=lambda name, text: chunks.append((name, text))
+        )
+
+        assert result == {
+            'stdout': 'привет\n2\n',
+            'stderr': 'warning\n',
+            'return_code': 0,
+            'timeout': False
+        }
+        assert chunks == [('stdout', 'привет\n'), ('stderr', 'warning\n'), ('stdout', '2\n')]
+        mock_post.assert_called_once_with(
+            'http://localhost:8000/run/stream',
+            json={'code': "print('привет')"},
+            stream=True
+        )
+
+
+class TestJobs:
+    """Тесты для функций submit_job() и get_job()"""
+
+    @patch('cupychecker.checker.requests.post')
+    def test_submit_job(self, mock_post):
+        """Тест постановки задания в очередь"""
+        mock_response = Mock()
+        mock_response.json.return_value = {"id": "abc", "status": "queued"}
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        result = submit_job("print('hello')")
+
+        assert result == {"id": "abc", "status": "queued"}
+        mock_post.assert_called_once_with(
+            'http://localhost:8000/jobs',
+            json={'code': "print('hello')"}
+        )
+
+    @patch('cupychecker.checker.requests.get')
+    def test_get_job_long_poll(self, mock_get):
+        """Тест получения результата задания с ожиданием"""
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            "id": "abc",
+            "status": "done",
+            "result": {"stdout": "hello\n", "stderr": "", "return_code": 0, "timeout": False}
+        }
+        mock_response.raise_for_status.return_value = None
+        mock_get.return_value = mock_response
+
+        result = get_job("abc", host='http://example.com:9000', wait=10)
+
+        assert result["status"] == "done"
+        assert result["result"]["stdout"] == "hello\n"
+        mock_get.assert_called_once_with(
+            'http://example.com:9000/jobs/abc',
+            params={'wait': 10}
+        )
+
+    @patch('cupychecker.checker.requests.get')
+    def test_get_job_not_found(self, mock_get):
+        """Тест обработки истёкшего или неизвестного задания"""
+        mock_response = Mock()
+        mock_response.raise_for_status.side_effect = requests.HTTPError("404 Not Found")
+        mock_get.return_value = mock_response
+
+        with pytest.raises(requests.HTTPError):
+            get_job("missing")
+
+
+class TestCheckCode:
+    """Тесты для функции check_code()"""
+
+    @patch('cupychecker.checker.requests.post')
+    def test_check_code(self, mock_post):
+        """Тест запуска и проверки кода на сервере за один запрос"""
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            "passed": False,
+            "message": "Не правильный вывод",
+            "result": {"stdout": "1\n", "stderr": "", "return_code": 0, "timeout": False}
+        }
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        result = check_code("print(1)", module="1", task="1")
+
+        assert result["passed"] is False
+        assert result["message"] == "Не правильный вывод"
+        mock_post.assert_called_once_with(
+            'http://localhost:8000/check',
+            json={'code': "print(1)", 'module': "1", 'task': "1"}
+        )
+
+
+class TestCheckSyntax:
+    """Тесты для функции check_syntax()"""
+
+    def test_check_syntax_valid(self):
+        """Корректный код на Runner отправляется"""
+        assert check_syntax("x = 1\nprint(x)") is None
+
+    def test_check_syntax_error(self):
+        """Синтаксическая ошибка возвращается в виде результата /run"""
+        result = check_syntax("x = 1\nprint(x")
+
+        assert result['return_code'] == 1
+        assert result['stdout'] == ''
+        assert 'SyntaxError' in result['stderr']
+        assert result['syntax_error']['line'] == 2
+        assert result['syntax_error']['offset'] == 6
+        assert result['syntax_error']['text'] == 'print(x'
+
+    @patch('cupychecker.checker.requests.post')
+    def test_check_syntax_no_request(self, mock_post):
+        """Проверка синтаксиса не обращается к Runner"""
+        check_syntax("def f(:")
+        mock_post.assert_not_called()
+
+    @pytest.mark.parametrize("code", ["-" * 100000 + "1", "a" + ".b" * 300000])
+    def test_check_syntax_parser_overflow(self, code):
+        """Переполнение стека парсера не роняет проверку: код уходит на Runner"""
+        assert check_syntax(code) is None
+
 
 class TestCheckResult:
     """Тесты для функции check_result()"""
@@ -0,0 +1,189 @@
+"""
+Тесты схлопывания одинаковых запусков runner (coalesce.Coalescer)
+"""
+import asyncio
+import pytest
+import coalesce
+from coalesce import Coalescer, IdempotencyConflict
+
+
+class Program:
+    """
+    Имитация запуска: считает вызовы и завершается, когда тест откроет release
+    """
+
+    def __init__(self, result="ok"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class TestCoalescer:
+    """Тесты Coalescer.run"""
+
+    def test_identical_requests_share_one_run(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            first = asyncio.ensure_future(coalescer.run("key", "fp", program))
+            second = asyncio.ensure_future(coalescer.run("key", "fp", program))
+            await asyncio.sleep(0)
+            assert len(coalescer) == 1
+            program.release.set()
+            return await first, await second, program.calls, len(coalescer)
+
+        first, second, calls, in_flight = asyncio.run(scenario())
+        assert first == ("ok", False)
+        assert second == ("ok", True)
+        assert calls == 1
+        assert in_flight == 0
+
+    def test_different_keys_run_separately(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            runs = [asyncio.ensure_future(coalescer.run(key, "fp", program)) for key in ("a", "b")]
+            await asyncio.sleep(0)
+            program.release.set()
+            return await asyncio.gather(*runs), program.calls
+
+        results, calls = asyncio.run(scenario())
+        assert results == [("ok", False), ("ok", False)]
+        assert calls == 2
+
+    def test_finished_result_is_retained(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(coalesce.time, "monotonic", lambda: now[0])
+
+        async def scenario():
+            coalescer = Coalescer(retention=30)
+            program = Program()
+            program.release.set()
+            results = [await coalescer.run("key", "fp", program)]
+            now[0] += 10
+            results.append(await coalescer.run("key", "fp", program))
+            calls = [program.calls]
+            now[0] += 30
+            results.append(await coalescer.run("key", "fp", program))
+            calls.append(program.calls)
+            return results, calls
+
+        results, calls = asyncio.run(scenario())
+        assert results == [("ok", False), ("ok", True), ("ok", False)]
+        # повтор в пределах retention не запускает программу, после — запускает
+        assert calls == [1, 2]
+
+    def test_no_retention(self):
+        async def scenario():
+            coalescer = Coalescer(retention=0)
+            program = Program()
+            program.release.set()
+            await coalescer.run("key", "fp", program)
+            await coalescer.run("key", "fp", program)
+            return program.calls
+
+        assert asyncio.run(scenario()) == 2
+
+    def test_max_results(self):
+        async def scenario():
+            coalescer = Coalescer(max_results=2)
+            program = Program()
+            program.release.set()
+            for key in ("a", "b", "c"):
+                await coalescer.run(key, "fp", program)
+            # самый старый результат вытеснен
+            shared = [(await coalescer.run(key, "fp", program))[1] for key in ("c", "a")]
+            return shared
+
+        assert asyncio.run(scenario()) == [True, False]
+
+    def test_conflict_while_in_flight(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            first = asyncio.ensure_future(coalescer.run("key", "fp", program))
+            await asyncio.sleep(0)
+            with pytest.raises(IdempotencyConflict):
+                await coalescer.run("key", "other", program)
+            program.release.set()
+            return await first
+
+        assert asyncio.run(scenario()) == ("ok", False)
+
+    def test_conflict_with_finished_result(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            program.release.set()
+            await coalescer.run("key", "fp", program)
+            with pytest.raises(IdempotencyConflict):
+                await coalescer.run("key", "other", program)
+
+        asyncio.run(scenario())
+
+    def test_failure_is_shared_but_not_retained(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program(RuntimeError("boom"))
+            runs = [asyncio.ensure_future(coalescer.run("key", "fp", program)) for _ in range(2)]
+            await asyncio.sleep(0)
+            program.release.set()
+            outcomes = await asyncio.gather(*runs, return_exceptions=True)
+            program.result = "ok"
+            return outcomes, await coalescer.run("key", "fp", program), program.calls
+
+        outcomes, retry, calls = asyncio.run(scenario())
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+        assert retry == ("ok", False)
+        assert calls == 2
+
+    def test_cancelled_leader_does_not_stop_followers(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            leader = asyncio.ensure_future(coalescer.run("key", "fp", program))
+            follower = asyncio.ensure_future(coalescer.run("key", "fp", program))
+            await asyncio.sleep(0)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            assert not program.cancelled
+            program.release.set()
+            return await follower, program.calls
+
+        result, calls = asyncio.run(scenario())
+        assert result == ("ok", True)
+        assert calls == 1
+
+    def test_run_cancelled_when_nobody_waits(self):
+        async def scenario():
+            coalescer = Coalescer()
+            program = Program()
+            waiters = [asyncio.ensure_future(coalescer.run("key", "fp", program)) for _ in range(2)]
+            await asyncio.sleep(0)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            await asyncio.sleep(0)
+            # отменённый запуск не запоминается, следующий запрос исполняется заново
+            program.release.set()
+            retry = await coalescer.run("key", "fp", program)
+            return program.cancelled, len(coalescer), retry, program.calls
+
+        cancelled, in_flight, retry, calls = asyncio.run(scenario())
+        assert cancelled
+        assert in_flight == 0
+        assert retry == ("ok", False)
+        assert calls == 2
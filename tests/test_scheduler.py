@@ -0,0 +1,196 @@
+"""
+Тесты справедливой очереди и ограничения частоты запусков runner
+"""
+import asyncio
+import pytest
+import scheduler
+from scheduler import FairQueue, RateLimiter, RateLimited, parse_weights
+
+
+def drain(queue, holder, tickets):
+    """
+    Освобождает слот по одному запуску и возвращает порядок, в котором
+    выдавались слоты ожидающим запросам
+    """
+    order = []
+    while True:
+        queue.release(holder.future.result(), holder)
+        ready = [ticket for ticket in tickets if ticket.ready and ticket not in order]
+        if not ready:
+            return order
+        assert len(ready) == 1
+        holder = ready[0]
+        order.append(holder)
+
+
+class TestParseWeights:
+    """Тесты разбора RUNNER__COURSE_WEIGHTS"""
+
+    def test_parse(self):
+        assert parse_weights("course_a=2, course_b=0.5") == {"course_a": 2.0, "course_b": 0.5}
+
+    def test_empty_and_incomplete_parts(self):
+        assert parse_weights("") == {}
+        assert parse_weights("course_a=,=2,course_b=1") == {"course_b": 1.0}
+
+
+class TestFairQueue:
+    """Тесты порядка выдачи слотов FairQueue"""
+
+    def test_free_slot_is_given_immediately(self):
+        async def scenario():
+            queue = FairQueue(["slot1"])
+            ticket = queue.enqueue("alice", "course")
+            assert ticket.ready
+            assert await queue.wait(ticket) == "slot1"
+            assert queue.busy == 1
+
+        asyncio.run(scenario())
+
+    def test_users_alternate_within_course(self):
+        """Пользователь с тремя запросами не обгоняет того, кто прислал один"""
+        async def scenario():
+            queue = FairQueue(["slot1"])
+            holder = queue.enqueue("alice", "course")
+            tickets = [queue.enqueue("alice", "course") for _ in range(2)]
+            tickets.append(queue.enqueue("bob", "course"))
+            order = drain(queue, holder, tickets)
+            return [ticket.user_id for ticket in order]
+
+        assert asyncio.run(scenario()) == ["bob", "alice", "alice"]
+
+    def test_fifo_within_user(self):
+        async def scenario():
+            queue = FairQueue(["slot1"])
+            holder = queue.enqueue("alice", "course")
+            tickets = [queue.enqueue("alice", "course") for _ in range(3)]
+            return drain(queue, holder, tickets) == tickets
+
+        assert asyncio.run(scenario())
+
+    def test_course_weights(self):
+        """Курс с весом 2 получает вдвое больше слотов, чем курс с весом 1"""
+        async def scenario():
+            queue = FairQueue(["slot1"], course_weights={"heavy": 2})
+            holder = queue.enqueue(None, None)
+            tickets = [queue.enqueue(f"h{index}", "heavy") for index in range(8)]
+            tickets += [queue.enqueue(f"l{index}", "light") for index in range(8)]
+            order = drain(queue, holder, tickets)
+            return [ticket.course_id for ticket in order[:6]]
+
+        courses = asyncio.run(scenario())
+        assert courses.count("heavy") == 4
+        assert courses.count("light") == 2
+
+    def test_max_per_user(self):
+        """Пользователь, у которого исполняется max_per_user программ, пропускает очередь"""
+        async def scenario():
+            queue = FairQueue(["slot1", "slot2"], max_per_user=1)
+            first = queue.enqueue("alice", "course")
+            second = queue.enqueue("alice", "course")
+            assert first.ready and not second.ready
+            other = queue.enqueue("bob", "course")
+            assert other.ready
+            queue.release(other.future.result(), other)
+            # свободный слот есть, но alice всё ещё упирается в лимит
+            assert not second.ready
+            queue.release(first.future.result(), first)
+            assert second.ready
+
+        asyncio.run(scenario())
+
+    def test_requests_without_user_are_not_capped(self):
+        async def scenario():
+            queue = FairQueue(["slot1", "slot2"], max_per_user=1)
+            tickets = [queue.enqueue() for _ in range(2)]
+            assert all(ticket.ready for ticket in tickets)
+
+        asyncio.run(scenario())
+
+    def test_cancelled_wait_leaves_queue(self):
+        async def scenario():
+            queue = FairQueue(["slot1"])
+            holder = queue.enqueue("alice", "course")
+            ticket = queue.enqueue("bob", "course")
+            waiter = asyncio.ensure_future(queue.wait(ticket))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert queue.waiting == 0
+            queue.release(holder.future.result(), holder)
+            assert queue.busy == 0
+
+        asyncio.run(scenario())
+
+    def test_position(self):
+        async def scenario():
+            queue = FairQueue(["slot1"])
+            holder = queue.enqueue("alice", "course")
+            tickets = [queue.enqueue("alice", "course") for _ in range(2)]
+            other = queue.enqueue("bob", "course")
+            return queue.position(holder), [queue.position(ticket) for ticket in tickets], queue.position(other)
+
+        held, alice, bob = asyncio.run(scenario())
+        assert held == 0
+        assert alice == [2, 3]
+        assert bob == 2
+
+
+class TestRateLimiter:
+    """Тесты token bucket на пользователя"""
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+        return now
+
+    def test_burst_then_limited(self, clock):
+        limiter = RateLimiter(rate=1, burst=2)
+        limiter.check("alice")
+        limiter.check("alice")
+        with pytest.raises(RateLimited) as exc:
+            limiter.check("alice")
+        assert exc.value.retry_after == pytest.approx(1.0)
+
+    def test_refill(self, clock):
+        limiter = RateLimiter(rate=2, burst=2)
+        limiter.check("alice", cost=2)
+        clock[0] += 0.25
+        with pytest.raises(RateLimited) as exc:
+            limiter.check("alice")
+        # набралось полтокена, до целого — ещё четверть секунды
+        assert exc.value.retry_after == pytest.approx(0.25)
+        clock[0] += 0.25
+        limiter.check("alice")
+
+    def test_refill_is_capped_by_burst(self, clock):
+        limiter = RateLimiter(rate=1, burst=2)
+        clock[0] += 3600
+        limiter.check("alice", cost=2)
+        with pytest.raises(RateLimited):
+            limiter.check("alice")
+
+    def test_users_have_separate_buckets(self, clock):
+        limiter = RateLimiter(rate=1, burst=1)
+        limiter.check("alice")
+        limiter.check("bob")
+        with pytest.raises(RateLimited):
+            limiter.check("alice")
+
+    def test_cost_above_burst_takes_whole_bucket(self, clock):
+        limiter = RateLimiter(rate=1, burst=5)
+        limiter.check("alice", cost=100)
+        with pytest.raises(RateLimited) as exc:
+            limiter.check("alice", cost=100)
+        assert exc.value.retry_after == pytest.approx(5.0)
+
+    def test_disabled(self, clock):
+        limiter = RateLimiter(rate=0, burst=1)
+        for _ in range(10):
+            limiter.check("alice")
+        # запросы без user_id не ограничиваются
+        limiter = RateLimiter(rate=1, burst=1)
+        for _ in range(10):
+            limiter.check(None)
@@ -0,0 +1,68 @@
+"""
+Тесты для модуля task_loader библиотеки cupychecker
+"""
+import pytest
+from unittest.mock import Mock, patch
+import requests
+from cupychecker import task_loader
+from cupychecker.task_loader import load_remote
+
+
+@pytest.fixture(autouse=True)
+def clear_remote_cache():
+    task_loader._remote_cache.clear()
+    yield
+    task_loader._remote_cache.clear()
+
+
+class TestLoadRemote:
+    """Тесты для функции load_remote()"""
+
+    @patch('cupychecker.task_loader.requests.get')
+    def test_load_remote_success(self, mock_get):
+        """Тест получения проверок с сервера"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.headers = {"ETag": '"abc"'}
+        mock_response.json.return_value = {"data": {"checks": []}}
+        mock_response.raise_for_status.return_value = None
+        mock_get.return_value = mock_response
+
+        result = load_remote("1", "2", host='http://example.com')
+
+        assert result == {"checks": []}
+        mock_get.assert_called_once_with(
+            'http://example.com/task_checks',
+            params={'module': "1", 'task': "2"},
+            headers=None
+        )
+
+    @patch('cupychecker.task_loader.requests.get')
+    def test_load_remote_not_modified(self, mock_get):
+        """Тест повторного запроса: при 304 возвращаются сохранённые проверки"""
+        first = Mock()
+        first.status_code = 200
+        first.headers = {"ETag": '"abc"'}
+        first.json.return_value = {"data": {"checks": [{"type": "var"}]}}
+        first.raise_for_status.return_value = None
+        second = Mock()
+        second.status_code = 304
+        mock_get.side_effect = [first, second]
+
+        load_remote("1", "2", host='http://example.com')
+        result = load_remote("1", "2", host='http://example.com')
+
+        assert result == {"checks": [{"type": "var"}]}
+        assert mock_get.call_args.kwargs['headers'] == {"If-None-Match": '"abc"'}
+        second.json.assert_not_called()
+
+    @patch('cupychecker.task_loader.requests.get')
+    def test_load_remote_not_found(self, mock_get):
+        """Тест обработки неизвестной задачи"""
+        mock_response = Mock()
+        mock_response.status_code = 404
+        mock_response.raise_for_status.side_effect = requests.HTTPError("404 Not Found")
+        mock_get.return_value = mock_response
+
+        with pytest.raises(requests.HTTPError):
+            load_remote("1", "404", host='http://example.com')
@@ -0,0 +1,140 @@
+"""
+Тесты перекодирования тел запросов и ответов runner (transport.TransportMiddleware)
+"""
+import asyncio
+import gzip
+import json
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+msgpack = pytest.importorskip("msgpack")
+import transport
+from transport import TransportMiddleware
+
+
+app = FastAPI()
+app.add_middleware(TransportMiddleware, min_size=0)
+
+
+@app.post("/echo")
+async def echo(request: Request):
+    return await request.json()
+
+
+@app.post("/echo/stream")
+async def echo_stream(request: Request):
+    data = await request.json()
+
+    async def events():
+        for item in data["items"]:
+            # как и в runner, между событиями управление уходит в event loop
+            await asyncio.sleep(0)
+            yield f"event: item\ndata: {json.dumps(item)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+PAYLOAD = {"items": ["print('привет')", 1, None]}
+
+
+def sse_items(text):
+    return [
+        json.loads(block.split("data: ", 1)[1])
+        for block in text.strip().split("\n\n") if block.startswith("event: item")
+    ]
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+class TestRequestBodies:
+    """Тесты тел запросов в msgpack и сжатых"""
+
+    def test_msgpack_body_to_stream(self, client):
+        response = client.post(
+            "/echo/stream", content=msgpack.packb(PAYLOAD), headers={"content-type": "application/msgpack"}
+        )
+        assert response.status_code == 200
+        assert sse_items(response.text) == PAYLOAD["items"]
+        assert "event: done" in response.text
+
+    def test_gzip_body_to_stream(self, client):
+        response = client.post(
+            "/echo/stream",
+            content=gzip.compress(json.dumps(PAYLOAD).encode()),
+            headers={"content-type": "application/json", "content-encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert sse_items(response.text) == PAYLOAD["items"]
+
+    def test_gzip_msgpack_body(self, client):
+        response = client.post(
+            "/echo",
+            content=gzip.compress(msgpack.packb(PAYLOAD)),
+            headers={"content-type": "application/msgpack", "content-encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.json() == PAYLOAD
+
+    def test_zstd_body_to_stream(self, client):
+        zstandard = pytest.importorskip("zstandard")
+        response = client.post(
+            "/echo/stream",
+            content=zstandard.ZstdCompressor().compress(json.dumps(PAYLOAD).encode()),
+            headers={"content-type": "application/json", "content-encoding": "zstd"}
+        )
+        assert response.status_code == 200
+        assert sse_items(response.text) == PAYLOAD["items"]
+
+    def test_malformed_body_has_detail(self, client):
+        # у msgpack.FormatError пустое сообщение
+        response = client.post("/echo", content=b"\xc1", headers={"content-type": "application/msgpack"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Malformed request body: FormatError"
+
+    def test_truncated_gzip(self, client):
+        response = client.post(
+            "/echo", content=gzip.compress(b'{"a": 1}')[:-10], headers={"content-encoding": "gzip"}
+        )
+        assert response.status_code == 400
+
+    def test_unsupported_encoding(self, client):
+        response = client.post("/echo", content=b"{}", headers={"content-encoding": "br"})
+        assert response.status_code == 400
+        assert "Unsupported Content-Encoding" in response.json()["detail"]
+
+    def test_decompressed_size_is_capped(self, client, monkeypatch):
+        monkeypatch.setattr(transport, "MAX_BODY_SIZE", 64 * 1024)
+        bomb = gzip.compress(b" " * (16 * 1024 * 1024))
+        assert len(bomb) < 64 * 1024
+        response = client.post("/echo", content=bomb, headers={"content-encoding": "gzip"})
+        assert response.status_code == 413
+
+
+class TestResponses:
+    """Тесты согласования формата ответа"""
+
+    def test_plain_json_by_default(self, client):
+        response = client.post("/echo", json=PAYLOAD, headers={"accept-encoding": "identity"})
+        assert response.headers["content-type"] == "application/json"
+        assert "content-encoding" not in response.headers
+        assert response.json() == PAYLOAD
+
+    def test_msgpack_gzip_response(self, client):
+        response = client.post(
+            "/echo", json=PAYLOAD, headers={"accept": "application/msgpack", "accept-encoding": "gzip"}
+        )
+        assert response.headers["content-type"] == "application/msgpack"
+        assert response.headers["content-encoding"] == "gzip"
+        # httpx уже распаковал gzip
+        assert msgpack.unpackb(response.content) == PAYLOAD
+
+    def test_stream_is_not_compressed(self, client):
+        response = client.post("/echo/stream", json=PAYLOAD, headers={"accept-encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert sse_items(response.text) == PAYLOAD["items"]